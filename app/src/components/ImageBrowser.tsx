@@ -238,6 +238,7 @@ const ImageBrowser: React.FC<ImageBrowserProps> = ({
           </button>
           <span className="text-sm text-slate-500 dark:text-slate-400 font-medium">
             Page {page + 1} of {data.total_pages}
+            {data.total_known ? "" : "+"}
           </span>
           <button
             onClick={goNext}
@@ -3,6 +3,9 @@ export interface GcsListResponse {
   total: number;
   page: number;
   total_pages: number;
+  // False while the server is still listing the prefix; total and
+  // total_pages are then lower bounds
+  total_known: boolean;
 }
 
 export async function listImages(
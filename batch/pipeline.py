@@ -6,14 +6,25 @@ is called as-is.
 """
 
 import asyncio
+import bisect
+import collections
+import contextlib
+import functools
+import hashlib
 import html as html_mod
+import logging
 import os
+import string
+import tempfile
 import traceback
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Literal
 
 import pandas as pd
 from google import genai
+from google.api_core.exceptions import NotFound
 from google.genai import types
 from google.genai.errors import ClientError
 from vertexai import Client as VertexClient
@@ -26,13 +37,24 @@ from product_fidelity_agent.config import (
     LOCATION,
     MAX_RETRIES,
     PASSING_THRESHOLD,
+    PIPELINE_CONCURRENCY,
     PROJECT_ID,
+    SPECULATIVE_GENERATION,
 )
 from product_fidelity_agent.tools.gcs import (
-    image_to_base64,
+    get_etag,
+    images_to_base64_batch,
     read_from_gcs,
     write_to_gcs,
 )
+from product_fidelity_agent.tools.gecko import (
+    RUBRIC_MAX_RETRIES,
+    rubric_retry_delay,
+    split_verdicts,
+)
+from product_fidelity_agent.tools.reporting import report_file_mode
+
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
 # Prompts (loaded once)
@@ -48,16 +70,8 @@ def _load_prompt(filename: str) -> str:
         return f.read()
 
 
-_SYSTEM_PROMPT: str | None = None
-_USER_PROMPT: str | None = None
-
-
-def _get_prompts() -> tuple[str, str]:
-    global _SYSTEM_PROMPT, _USER_PROMPT
-    if _SYSTEM_PROMPT is None:
-        _SYSTEM_PROMPT = _load_prompt("description_system.txt")
-        _USER_PROMPT = _load_prompt("description_user.txt")
-    return _SYSTEM_PROMPT, _USER_PROMPT
+_SYSTEM_PROMPT = _load_prompt("description_system.txt")
+_USER_PROMPT = _load_prompt("description_user.txt")
 
 
 _RECONTEXTUALIZATION_PROMPT = (
@@ -74,12 +88,30 @@ _RECONTEXTUALIZATION_PROMPT = (
     "logos, or any visual details."
 )
 
+# Static refinement instructions come first so every refine call shares the
+# same prefix; the per-product failing attributes and description follow.
+_REFINE_INSTRUCTIONS = """You are refining a product description for text-to-image generation.
+
+The original description was used to generate an image, but some attributes
+were NOT faithfully reproduced in the generated image. They are listed under
+FAILING ATTRIBUTES below, followed by the ORIGINAL DESCRIPTION.
+
+Your task: Rewrite the description to MORE STRONGLY EMPHASIZE the failing attributes.
+- Keep ALL original details intact
+- Add stronger, more explicit language for the failing attributes
+- Add spatial/visual cues that help image generation models render these attributes correctly
+- Do NOT remove any attributes — reinforce them
+- Do NOT add new attributes that were not in the original
+- Output only the refined description paragraph. 750 words max."""
+
 # ---------------------------------------------------------------------------
 # Gemini client helper
 # ---------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=1)
 def _gemini_client() -> genai.Client:
+    """Return the shared Gemini client (constructed once per process)."""
     return genai.Client(
         vertexai=True,
         project=PROJECT_ID,
@@ -97,23 +129,38 @@ def _gemini_client() -> genai.Client:
     )
 
 
+@functools.lru_cache(maxsize=1)
+def _vertex_client() -> VertexClient:
+    """Return the shared Vertex AI client used for Gecko evaluation."""
+    return VertexClient(project=PROJECT_ID, location=LOCATION)
+
+
 # ---------------------------------------------------------------------------
 # Async wrappers for tool functions
 # ---------------------------------------------------------------------------
 
-sem = asyncio.Semaphore(5)
+_MIME_MAP = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "gif": "image/gif",
+}
 
 
-async def _describe(image_uri: str) -> str:
+def _mime_for(uri: str) -> str:
+    """Return the image MIME type for a URI based on its extension."""
+    ext = uri.rpartition(".")[2].lower()
+    return _MIME_MAP.get(ext) or f"image/{ext}"
+
+
+async def _generate_description(image_uri: str) -> str:
     """Generate a ground-truth description from a reference image."""
-    system_prompt, user_prompt = _get_prompts()
     client = _gemini_client()
 
-    ext = image_uri.lower().rsplit(".", 1)[-1]
-    mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
     content_parts = [
-        types.Part.from_uri(file_uri=image_uri, mime_type=mime),
-        user_prompt,
+        types.Part.from_uri(file_uri=image_uri, mime_type=_mime_for(image_uri)),
+        _USER_PROMPT,
     ]
 
     response = await asyncio.to_thread(
@@ -121,59 +168,109 @@ async def _describe(image_uri: str) -> str:
         model=DESCRIPTION_MODEL,
         contents=content_parts,
         config=types.GenerateContentConfig(
-            system_instruction=system_prompt,
+            system_instruction=_SYSTEM_PROMPT,
             temperature=1,
         ),
     )
     return response.text
 
 
-async def _refine(original_description: str, failing_verdicts: str) -> str:
-    """Refine a description to emphasize failing attributes."""
-    client = _gemini_client()
+# Descriptions are cached in GCS keyed by reference URI and etag, description
+# model, and prompt text, so re-running a batch skips the multimodal describe
+# call while a reference re-uploaded to the same URI is described afresh.
+_PROMPT_FINGERPRINT = hashlib.sha256(
+    (_SYSTEM_PROMPT + _USER_PROMPT).encode("utf-8")
+).hexdigest()
 
-    refinement_prompt = f"""You are refining a product description for text-to-image generation.
+# In-process front for the GCS cache, keyed by cache URI. Bounded so a
+# long-lived server doesn't accumulate descriptions across batches.
+_description_memo: dict[str, str] = {}
+_MAX_DESCRIPTION_MEMO = 256
 
-The original description was used to generate an image, but the following attributes
-were NOT faithfully reproduced in the generated image:
 
-FAILING ATTRIBUTES:
-{failing_verdicts}
+def _description_cache_uri(image_uri: str, etag: str) -> str:
+    key = hashlib.sha256(
+        f"{image_uri}|{etag}|{DESCRIPTION_MODEL}|{_PROMPT_FINGERPRINT}".encode("utf-8")
+    ).hexdigest()
+    return f"gs://{BUCKET_NAME}/descriptions/{key}.txt"
 
-ORIGINAL DESCRIPTION:
-{original_description}
 
-Your task: Rewrite the description to MORE STRONGLY EMPHASIZE the failing attributes.
-- Keep ALL original details intact
-- Add stronger, more explicit language for the failing attributes
-- Add spatial/visual cues that help image generation models render these attributes correctly
-- Do NOT remove any attributes — reinforce them
-- Do NOT add new attributes that were not in the original
-- Output only the refined description paragraph. 750 words max."""
+async def _describe(image_uri: str) -> str:
+    """Return the ground-truth description, reusing a cached one if present.
+
+    The cache is best-effort: any failure to look it up or write it falls
+    back to (or just keeps) a freshly generated description.
+    """
+    try:
+        etag = await asyncio.to_thread(get_etag, image_uri)
+    except Exception as e:
+        logger.warning(
+            "Could not look up %s, skipping description cache: %s", image_uri, e
+        )
+        return await _generate_description(image_uri)
+
+    cache_uri = _description_cache_uri(image_uri, etag)
+    if cache_uri in _description_memo:
+        return _description_memo[cache_uri]
+
+    description = None
+    try:
+        cached = await asyncio.to_thread(read_from_gcs, cache_uri)
+        description = cached.decode("utf-8")
+    except NotFound:
+        pass
+    except Exception as e:
+        logger.warning(
+            "Could not read cached description for %s: %s", image_uri, e
+        )
+
+    if not description:
+        description = await _generate_description(image_uri)
+        if description:
+            try:
+                await asyncio.to_thread(
+                    write_to_gcs, description.encode("utf-8"), cache_uri
+                )
+            except Exception as e:
+                logger.warning(
+                    "Failed to cache description for %s: %s", image_uri, e
+                )
+
+    if description:
+        while len(_description_memo) >= _MAX_DESCRIPTION_MEMO:
+            _description_memo.pop(next(iter(_description_memo)))
+        _description_memo[cache_uri] = description
+    return description
+
+
+async def _refine(original_description: str, failing_verdicts: str) -> str:
+    """Refine a description to emphasize failing attributes."""
+    client = _gemini_client()
 
+    dynamic_part = (
+        f"FAILING ATTRIBUTES:\n{failing_verdicts}\n\n"
+        f"ORIGINAL DESCRIPTION:\n{original_description}"
+    )
     response = await asyncio.to_thread(
         client.models.generate_content,
         model=DESCRIPTION_MODEL,
-        contents=refinement_prompt,
+        contents=[_REFINE_INSTRUCTIONS, dynamic_part],
         config=types.GenerateContentConfig(temperature=0.7),
     )
     return response.text
 
 
-async def _generate_image(
+async def _call_image_model(
     image_uri: str,
-    sku_id: str,
     attempt: int,
     current_description: str | None = None,
     failing_verdicts_text: str | None = None,
-) -> str:
-    """Generate a recontextualized product image. Returns the GCS URI."""
+) -> bytes:
+    """Generate a recontextualized product image. Returns the raw image bytes."""
     client = _gemini_client()
 
-    ext = image_uri.lower().rsplit(".", 1)[-1]
-    mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
     content_parts = [
-        types.Part.from_uri(file_uri=image_uri, mime_type=mime),
+        types.Part.from_uri(file_uri=image_uri, mime_type=_mime_for(image_uri)),
     ]
 
     if attempt > 1 and current_description and failing_verdicts_text:
@@ -197,125 +294,338 @@ async def _generate_image(
         ),
     )
 
-    for part in response.parts:
-        if part.inline_data is not None:
-            image_bytes = part.inline_data.data
-            image_id = str(uuid.uuid4())[:8]
-            gcs_path = (
-                f"gs://{BUCKET_NAME}/generated/{sku_id}/"
-                f"attempt_{attempt}_{image_id}.png"
-            )
-            await asyncio.to_thread(write_to_gcs, image_bytes, gcs_path)
-            return gcs_path
+    # response.parts is None when the model returned no candidates
+    image_part = next(
+        (p for p in response.parts or [] if p.inline_data is not None), None
+    )
+    if image_part is None:
+        raise RuntimeError("No image was generated by the model.")
+    return image_part.inline_data.data
+
 
-    raise RuntimeError("No image was generated by the model.")
+async def _persist_image(image_bytes: bytes, sku_id: str, attempt: int) -> str:
+    """Upload a generated image to GCS. Returns the GCS URI."""
+    image_id = str(uuid.uuid4())[:8]
+    gcs_path = (
+        f"gs://{BUCKET_NAME}/generated/{sku_id}/"
+        f"attempt_{attempt}_{image_id}.png"
+    )
+    await asyncio.to_thread(write_to_gcs, image_bytes, gcs_path)
+    return gcs_path
 
 
-RUBRIC_MAX_RETRIES = 3
-RUBRIC_RETRY_DELAY = 10  # seconds
+async def _generate_image(
+    image_uri: str,
+    sku_id: str,
+    attempt: int,
+    current_description: str | None = None,
+    failing_verdicts_text: str | None = None,
+) -> str:
+    """Generate a recontextualized product image and upload it. Returns the GCS URI."""
+    image_bytes = await _call_image_model(
+        image_uri, attempt, current_description, failing_verdicts_text
+    )
+    return await _persist_image(image_bytes, sku_id, attempt)
 
 
-async def _gecko_eval(prompt: str, image_uri: str) -> dict:
-    """Run Gecko text-to-image evaluation. Returns dict with score and verdicts."""
+GECKO_BATCH_SIZE = 8
+GECKO_BATCH_WINDOW = 0.5  # seconds to wait for more items before dispatching
 
-    def _call():
-        vertex_client = VertexClient(project=PROJECT_ID, location=LOCATION)
 
-        response_data = {
-            "parts": [
-                {"file_data": {"mime_type": "image/png", "file_uri": image_uri}}
-            ],
-            "role": "model",
-        }
-        eval_dataset = pd.DataFrame(
-            {"prompt": [prompt], "response": [response_data]}
+def _rubrics_df(data_with_rubrics) -> pd.DataFrame | None:
+    """Return the DataFrame behind a generate_rubrics result."""
+    if isinstance(data_with_rubrics, pd.DataFrame):
+        return data_with_rubrics
+    return getattr(data_with_rubrics, "eval_dataset_df", None)
+
+
+def _rubrics_ready(df: pd.DataFrame | None) -> bool:
+    """Check that generate_rubrics actually produced rubric content for every row.
+
+    The SDK may silently swallow errors and return data with empty rubrics.
+    """
+    return bool(
+        df is not None
+        and "rubric_groups" in df.columns
+        and len(df) > 0
+        and all(bool(groups) for groups in df["rubric_groups"])
+    )
+
+
+def _image_response(image_uri: str) -> dict:
+    """Build the eval dataset 'response' cell for a candidate image."""
+    return {
+        "parts": [
+            {"file_data": {"mime_type": "image/png", "file_uri": image_uri}}
+        ],
+        "role": "model",
+    }
+
+
+def _extract_case_result(case) -> dict:
+    """Extract the score and verdicts from a single evaluation case."""
+    metric_data = case.response_candidate_results[0].metric_results
+    metric_key = list(metric_data.keys())[0]
+    data = metric_data[metric_key]
+    score = data.score
+    verdicts = data.rubric_verdicts
+
+    if score is None and not verdicts:
+        raise RuntimeError(
+            "Evaluation infrastructure error: no score or verdicts returned."
         )
 
-        # Generate rubrics with retry on rate-limit (429) errors
-        data_with_rubrics = None
-        for rubric_attempt in range(1, RUBRIC_MAX_RETRIES + 1):
-            try:
-                data_with_rubrics = vertex_client.evals.generate_rubrics(
+    score = score if score is not None else 0.0
+
+    passing, failing = split_verdicts(verdicts or ())
+
+    return {
+        "score": score,
+        "passing_verdicts": passing,
+        "failing_verdicts": failing,
+        "total_verdicts": len(passing) + len(failing),
+        "passing_count": len(passing),
+        "failing_count": len(failing),
+    }
+
+
+def _evaluate_with_rubrics(
+    vertex_client: VertexClient, data_with_rubrics, row_count: int
+) -> list[dict | Exception]:
+    """Run Gecko evaluation on a dataset with rubrics.
+
+    Returns one entry per dataset row, in row order: the extracted result
+    dict, or the exception raised while extracting that row.
+    """
+    eval_result = vertex_client.evals.evaluate(
+        dataset=data_with_rubrics,
+        metrics=[vertex_types.RubricMetric.GECKO_TEXT2IMAGE],
+    )
+
+    results: list[dict | Exception] = [
+        RuntimeError("Evaluation infrastructure error: no result returned.")
+    ] * row_count
+    for case in eval_result.eval_case_results:
+        try:
+            results[case.eval_case_index] = _extract_case_result(case)
+        except Exception as e:
+            results[case.eval_case_index] = e
+    return results
+
+
+async def _generate_rubrics(
+    vertex_client: VertexClient, items: list[tuple[str, str]]
+) -> pd.DataFrame:
+    """Generate Gecko rubrics for several (prompt, image_uri) pairs in one call.
+
+    Returns the dataset with a populated 'rubric_groups' column, one row per
+    pair in order. Only the blocking SDK call runs in a worker thread; retry
+    waits use asyncio.sleep so they don't tie up a thread.
+    """
+    # generate_rubrics takes a DataFrame (or EvaluationDataset), not plain
+    # records, so build it once here rather than per rubric retry
+    eval_dataset = pd.DataFrame(
+        {
+            "prompt": [prompt for prompt, _ in items],
+            "response": [_image_response(uri) for _, uri in items],
+        }
+    )
+
+    # Generate rubrics with retry on rate-limit (429) errors
+    df = None
+    for rubric_attempt in range(1, RUBRIC_MAX_RETRIES + 1):
+        try:
+            df = _rubrics_df(
+                await asyncio.to_thread(
+                    vertex_client.evals.generate_rubrics,
                     src=eval_dataset,
                     rubric_group_name="gecko_image_rubrics",
                     predefined_spec_name=vertex_types.RubricMetric.GECKO_TEXT2IMAGE,
                 )
-                if isinstance(data_with_rubrics, pd.DataFrame):
-                    df = data_with_rubrics
-                else:
-                    df = getattr(data_with_rubrics, "eval_dataset_df", None)
-                if (
-                    df is not None
-                    and "rubric_groups" in df.columns
-                    and len(df) > 0
-                    and df["rubric_groups"].iloc[0]
-                ):
-                    break
-                print(
-                    f"Rubric generation returned empty results "
-                    f"(attempt {rubric_attempt}/{RUBRIC_MAX_RETRIES}), retrying..."
+            )
+            if _rubrics_ready(df):
+                break
+            logger.warning(
+                "Rubric generation returned empty results "
+                "(attempt %d/%d), retrying...",
+                rubric_attempt, RUBRIC_MAX_RETRIES,
+            )
+            if rubric_attempt < RUBRIC_MAX_RETRIES:
+                await asyncio.sleep(rubric_retry_delay(rubric_attempt))
+        except ClientError as e:
+            if e.status_code == 429 and rubric_attempt < RUBRIC_MAX_RETRIES:
+                delay = rubric_retry_delay(rubric_attempt, e)
+                logger.warning(
+                    "Rubric generation rate-limited (attempt %d/%d), "
+                    "retrying in %.1fs...",
+                    rubric_attempt, RUBRIC_MAX_RETRIES, delay,
                 )
-                if rubric_attempt < RUBRIC_MAX_RETRIES:
-                    import time
-                    time.sleep(RUBRIC_RETRY_DELAY)
-            except ClientError as e:
-                if e.status_code == 429 and rubric_attempt < RUBRIC_MAX_RETRIES:
-                    print(
-                        f"Rubric generation rate-limited "
-                        f"(attempt {rubric_attempt}/{RUBRIC_MAX_RETRIES}), "
-                        f"retrying in {RUBRIC_RETRY_DELAY}s..."
-                    )
-                    import time
-                    time.sleep(RUBRIC_RETRY_DELAY)
-                else:
-                    raise
+                await asyncio.sleep(delay)
+            else:
+                raise
 
-        # Evaluate
-        eval_result = vertex_client.evals.evaluate(
-            dataset=data_with_rubrics,
-            metrics=[vertex_types.RubricMetric.GECKO_TEXT2IMAGE],
+    if df is None or len(df) != len(items):
+        raise RuntimeError("Evaluation infrastructure error: no rubrics returned.")
+    return df.reset_index(drop=True)
+
+
+async def _gecko_eval_batch(
+    items: list[tuple[str, str, pd.DataFrame | None]],
+) -> list[tuple[dict, pd.DataFrame | None] | Exception]:
+    """Run Gecko text-to-image evaluation for several images in one call.
+
+    Each item is (prompt, image_uri, rubrics). *rubrics* is the single-row
+    rubric dataset returned by an earlier evaluation of the same product, or
+    None to generate rubrics from *prompt*. Rows lacking rubrics share one
+    generate_rubrics call, then all rows share one evaluate call.
+
+    Returns one entry per item: (result dict, rubrics to reuse on the next
+    attempt), or the exception raised for that row.
+    """
+    vertex_client = await asyncio.to_thread(_vertex_client)
+
+    rubric_rows = [rubrics for _, _, rubrics in items]
+    missing = [i for i, rubrics in enumerate(rubric_rows) if rubrics is None]
+    if missing:
+        generated = await _generate_rubrics(
+            vertex_client, [items[i][:2] for i in missing]
         )
+        for k, i in enumerate(missing):
+            rubric_rows[i] = generated.iloc[[k]]
+
+    # Reuse each row's rubrics, swapping in the candidate image to evaluate
+    eval_dataset = pd.concat(
+        [
+            rubrics.assign(response=[_image_response(image_uri)])
+            for rubrics, (_, image_uri, _) in zip(rubric_rows, items)
+        ],
+        ignore_index=True,
+    )
+    results = await asyncio.to_thread(
+        _evaluate_with_rubrics, vertex_client, eval_dataset, len(items)
+    )
 
-        # Extract results
-        case = eval_result.eval_case_results[0]
-        metric_data = case.response_candidate_results[0].metric_results
-        metric_key = list(metric_data.keys())[0]
-        data = metric_data[metric_key]
-        score = data.score
-        verdicts = data.rubric_verdicts
-
-        if score is None and not verdicts:
-            raise RuntimeError(
-                "Evaluation infrastructure error: no score or verdicts returned."
-            )
+    return [
+        result if isinstance(result, Exception)
+        # Only carry rubrics forward if they are usable
+        else (result, rubrics if _rubrics_ready(rubrics) else None)
+        for result, rubrics in zip(results, rubric_rows)
+    ]
+
+
+class _GeckoBatcher:
+    """Collects Gecko evaluations from concurrent images into micro-batches.
 
-        score = score if score is not None else 0.0
+    Each submit() waits on a future that is resolved once the batch holding
+    its item has been evaluated. A batch is dispatched when it reaches
+    *max_batch* items (no more images can be waiting than are running) or
+    GECKO_BATCH_WINDOW seconds after its first item. Owned by one run_batch
+    call, so concurrent batches don't share or tear down each other's.
+    """
 
-        passing = []
-        failing = []
-        if verdicts:
-            for v in verdicts:
-                raw_verdict = getattr(v, "verdict", False)
-                is_pass = str(raw_verdict).lower() == "true"
+    def __init__(self, max_batch: int = GECKO_BATCH_SIZE) -> None:
+        self._max_batch = max(1, min(GECKO_BATCH_SIZE, max_batch))
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._collector: asyncio.Task | None = None
+        self._dispatches: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self) -> None:
+        tasks = [self._collector, *self._dispatches]
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*[t for t in tasks if t is not None], return_exceptions=True)
+
+    async def submit(
+        self, prompt: str, image_uri: str, rubrics: pd.DataFrame | None
+    ) -> tuple[dict, pd.DataFrame | None]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((prompt, image_uri, rubrics), future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + GECKO_BATCH_WINDOW
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
                 try:
-                    text = v.evaluated_rubric.content.property.description
-                except AttributeError:
-                    text = str(v)
-                if is_pass:
-                    passing.append(text)
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list[tuple[tuple, asyncio.Future]]) -> None:
+        # Skip items whose submitter was cancelled while waiting
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            try:
+                results = await _gecko_eval_batch([item for item, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
                 else:
-                    failing.append(text)
-
-        return {
-            "score": score,
-            "passing_verdicts": passing,
-            "failing_verdicts": failing,
-            "total_verdicts": len(passing) + len(failing),
-            "passing_count": len(passing),
-            "failing_count": len(failing),
-        }
+                    # A shared call failed (e.g. one bad prompt in rubric
+                    # generation); retry each item alone so the failure
+                    # only costs the image it belongs to
+                    logger.warning(
+                        "Gecko batch of %d failed, retrying individually: %s",
+                        len(batch), e,
+                    )
+                    results = await asyncio.gather(
+                        *[self._evaluate_one(item) for item, _ in batch]
+                    )
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    @staticmethod
+    async def _evaluate_one(
+        item: tuple,
+    ) -> tuple[dict, pd.DataFrame | None] | Exception:
+        try:
+            return (await _gecko_eval_batch([item]))[0]
+        except Exception as e:
+            return e
+
 
-    return await asyncio.to_thread(_call)
+async def _gecko_eval(
+    prompt: str,
+    image_uri: str,
+    rubrics: pd.DataFrame | None = None,
+    batcher: _GeckoBatcher | None = None,
+) -> tuple[dict, pd.DataFrame | None]:
+    """Run Gecko text-to-image evaluation.
+
+    Pass the rubrics returned by a previous call for the same product to skip
+    rubric generation. Returns (dict with score and verdicts, rubrics to
+    reuse). With a *batcher*, evaluations are micro-batched with other
+    images in the same run.
+    """
+    if batcher is not None:
+        return await batcher.submit(prompt, image_uri, rubrics)
+    result = (await _gecko_eval_batch([(prompt, image_uri, rubrics)]))[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
 
 
 # ---------------------------------------------------------------------------
@@ -323,10 +633,20 @@ async def _gecko_eval(prompt: str, image_uri: str) -> dict:
 # ---------------------------------------------------------------------------
 
 
-async def process_image(uri: str, progress_queue: asyncio.Queue) -> dict:
-    """Run the full describe -> generate -> evaluate -> retry pipeline for one image."""
+async def process_image(
+    uri: str,
+    progress_queue: asyncio.Queue,
+    sem: asyncio.Semaphore,
+    batcher: _GeckoBatcher | None = None,
+) -> dict:
+    """Run the full describe -> generate -> evaluate -> retry pipeline for one image.
+
+    *sem* bounds how many images are in flight across the batch; *batcher*,
+    if given, micro-batches Gecko evaluations with the other images.
+    """
     sku_id = Path(uri).stem
     evaluation_history = []
+    speculative: asyncio.Task | None = None
 
     async with sem:
         await progress_queue.put({"sku": sku_id, "status": "running"})
@@ -336,15 +656,35 @@ async def process_image(uri: str, progress_queue: asyncio.Queue) -> dict:
             description = await _describe(uri)
             original_description = description
             failing_verdicts_text = None
+            # Rubrics derive from the original description, so they are
+            # generated on the first attempt and reused for retries
+            rubrics = None
 
             for attempt in range(1, MAX_RETRIES + 1):
-                # Step 2: Generate candidate image
-                candidate_uri = await _generate_image(
-                    uri, sku_id, attempt, description, failing_verdicts_text
-                )
+                # Step 2: Generate candidate image (or take the speculative one)
+                if speculative is not None:
+                    candidate_uri = await speculative
+                    speculative = None
+                else:
+                    candidate_uri = await _generate_image(
+                        uri, sku_id, attempt, description, failing_verdicts_text
+                    )
+
+                # Optionally generate the next attempt while this one is
+                # evaluated. This attempt's verdicts aren't known yet, so the
+                # speculative image uses the latest available refinement.
+                if SPECULATIVE_GENERATION and attempt < MAX_RETRIES:
+                    speculative = asyncio.create_task(
+                        _generate_image(
+                            uri, sku_id, attempt + 1,
+                            description, failing_verdicts_text,
+                        )
+                    )
 
-                # Step 3: Evaluate with Gecko
-                result = await _gecko_eval(description, candidate_uri)
+                # Step 3: Evaluate with Gecko against the original description
+                result, rubrics = await _gecko_eval(
+                    original_description, candidate_uri, rubrics, batcher
+                )
 
                 evaluation_history.append({
                     "attempt": attempt,
@@ -376,7 +716,9 @@ async def process_image(uri: str, progress_queue: asyncio.Queue) -> dict:
                 failing_verdicts_text = "\n".join(
                     f"- {v}" for v in result["failing_verdicts"]
                 )
-                if attempt < MAX_RETRIES:
+                # The refinement feeds the next generation not yet started
+                next_unstarted = attempt + (2 if SPECULATIVE_GENERATION else 1)
+                if next_unstarted <= MAX_RETRIES:
                     description = await _refine(
                         original_description, failing_verdicts_text
                     )
@@ -434,6 +776,10 @@ async def process_image(uri: str, progress_queue: asyncio.Queue) -> dict:
                 "evaluation_history": evaluation_history,
                 "error": str(e),
             }
+        finally:
+            # Drop any speculative attempt that is no longer needed
+            if speculative is not None:
+                speculative.cancel()
 
 
 # ---------------------------------------------------------------------------
@@ -441,22 +787,95 @@ async def process_image(uri: str, progress_queue: asyncio.Queue) -> dict:
 # ---------------------------------------------------------------------------
 
 
+async def _process_concurrently(
+    image_uris: list[str],
+    progress_queue: asyncio.Queue,
+    sem: asyncio.Semaphore,
+    batcher: _GeckoBatcher | None,
+) -> list[dict]:
+    """Run process_image for every URI at once (bounded by *sem*)."""
+    tasks = [
+        asyncio.create_task(process_image(uri, progress_queue, sem, batcher))
+        for uri in image_uris
+    ]
+    try:
+        # Collect results as they finish rather than holding every coroutine
+        # frame until the slowest image completes
+        results = []
+        for next_done in asyncio.as_completed(tasks):
+            results.append(await next_done)
+        return results
+    finally:
+        # Propagate cancellation to any images still in flight
+        for task in tasks:
+            task.cancel()
+
+
 async def run_batch(
     image_uris: list[str],
     progress_queue: asyncio.Queue,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    mode: Literal["gather", "sequential", "chunked"] = "gather",
+    chunk_size: int = 8,
 ) -> list[dict]:
-    """Process all images concurrently and return sorted results."""
-    results = await asyncio.gather(
-        *[process_image(uri, progress_queue) for uri in image_uris],
-        return_exceptions=False,
-    )
+    """Process all images and return sorted results.
+
+    *mode* controls how many images are alive at once:
+      - "gather": schedule every image up front; at most *concurrency* run
+        at once (defaults to the PIPELINE_CONCURRENCY env var).
+      - "chunked": process *chunk_size* images at a time, each chunk
+        finishing before the next starts.
+      - "sequential": process one image at a time.
+    The bounded modes cap peak memory on constrained hosts at some
+    throughput cost.
+    """
+    if mode not in ("gather", "sequential", "chunked"):
+        raise ValueError(f"Unknown batch mode: {mode!r}")
+
+    # Build the shared clients off the event loop (credential discovery blocks)
+    await asyncio.to_thread(_gemini_client)
+    await asyncio.to_thread(_vertex_client)
+
+    # Micro-batch Gecko calls only when several images can evaluate at once;
+    # with one in flight the batch window would be pure added latency
+    max_in_flight = 1 if mode == "sequential" else concurrency
+    if mode == "chunked":
+        max_in_flight = min(max_in_flight, chunk_size)
+    batcher = _GeckoBatcher(max_in_flight) if max_in_flight > 1 else None
+    if batcher is not None:
+        batcher.start()
+
+    sem = asyncio.Semaphore(concurrency)
+    try:
+        if mode == "sequential":
+            results = []
+            for uri in image_uris:
+                results.append(await process_image(uri, progress_queue, sem))
+        elif mode == "chunked":
+            results = []
+            for start in range(0, len(image_uris), chunk_size):
+                results.extend(
+                    await _process_concurrently(
+                        image_uris[start:start + chunk_size],
+                        progress_queue, sem, batcher,
+                    )
+                )
+        else:
+            results = await _process_concurrently(
+                image_uris, progress_queue, sem, batcher
+            )
+    finally:
+        if batcher is not None:
+            await batcher.stop()
     # Sort lowest score first (worst products surface for review)
     results = sorted(results, key=lambda r: r["score"])
 
-    await progress_queue.put({"status": "complete", "total": len(results)})
+    # Generate batch report off the event loop, then signal completion so
+    # clients only fetch the report once it exists
+    await progress_queue.put({"status": "reporting", "total": len(results)})
+    await asyncio.to_thread(_generate_report, results)
 
-    # Generate batch report
-    _generate_report(results)
+    await progress_queue.put({"status": "complete", "total": len(results)})
 
     return results
 
@@ -465,9 +884,100 @@ async def run_batch(
 # Report generation
 # ---------------------------------------------------------------------------
 
+# Sections whose images are fetched ahead of the one being written, and
+# concurrent downloads per section (so at most 4 * 2 in flight)
+REPORT_PREFETCH_SECTIONS = 4
+REPORT_IMAGES_PER_SECTION = 2
 
-def _build_product_section(product: dict) -> str:
-    """Build the HTML section for a single product in the batch report."""
+# Static report scaffold. string.Template ($name placeholders) keeps the CSS
+# braces literal instead of doubling them as an f-string would require.
+_REPORT_HEAD = string.Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>$title</title>
+<style>
+  body { font-family:'Segoe UI',Tahoma,Geneva,Verdana,sans-serif; margin:0; background:#f4f4f4; color:#333; }
+  .container { max-width:1100px; margin:30px auto; background:#fff; padding:30px; border-radius:8px; box-shadow:0 2px 15px rgba(0,0,0,.08); }
+  h1 { color:#1a73e8; margin-top:0; border-bottom:2px solid #eee; padding-bottom:10px; }
+  .summary { margin-bottom:30px; padding:20px; background:#f8f9fa; border-radius:8px; }
+  .summary h2 { margin-top:0; color:#333; }
+  .summary-grid { display:flex; gap:16px; flex-wrap:wrap; }
+  .summary-card { flex:1; min-width:120px; padding:16px; background:#fff; border-radius:8px; border-left:4px solid #1a73e8; text-align:center; }
+  .summary-value { font-size:1.8em; font-weight:bold; color:#1a73e8; }
+  .summary-label { font-size:0.85em; color:#666; margin-top:4px; }
+  .product-section { margin-bottom:30px; }
+  .product-header { margin-top:0; padding-bottom:8px; border-bottom:1px solid #eee; }
+  .product-divider { border:none; border-top:3px solid #e0e0e0; margin:30px 0; }
+  .meta { display:flex; gap:20px; margin-bottom:20px; background:#f8f9fa; padding:15px; border-radius:6px; }
+  .meta-images { display:flex; gap:12px; flex-wrap:wrap; }
+  .meta-prompt { flex:1; font-size:.9em; line-height:1.5; max-height:200px; overflow-y:auto; white-space:pre-wrap; background:#fff; padding:12px; border:1px solid #eee; border-radius:4px; }
+  .attempt { border:1px solid #e0e0e0; border-radius:8px; margin-bottom:10px; overflow:hidden; }
+  .attempt[open] { box-shadow:0 2px 8px rgba(0,0,0,.1); }
+  .attempt summary { padding:14px 18px; background:#fafafa; cursor:pointer; display:flex; align-items:center; gap:12px; list-style:none; }
+  .attempt summary::-webkit-details-marker { display:none; }
+  .attempt-label { font-weight:600; }
+  .attempt-content { display:flex; gap:20px; padding:18px; }
+  .attempt-image { flex:0 0 250px; }
+  .attempt-image img { max-width:100%; height:auto; }
+  .attempt-verdicts { flex:1; }
+  .score-badge { display:inline-block; padding:4px 12px; border-radius:14px; font-weight:bold; font-size:.9em; }
+  .score-high { background:#e6f4ea; color:#188038; }
+  .score-medium { background:#fef7e0; color:#b06000; }
+  .score-low { background:#fce8e6; color:#d93025; }
+  .stats { color:#666; font-size:.85em; }
+  .rubric-list { list-style:none; padding:0; margin:0; }
+  .rubric-item { margin-bottom:5px; padding:8px 10px; border-left:4px solid; border-radius:3px; font-size:.9em; }
+  .rubric-pass { border-color:#188038; background:#f6fef7; }
+  .rubric-fail { border-color:#d93025; background:#fef7f6; }
+  .icon { margin-right:6px; }
+</style>
+</head>
+<body>
+<div class="container">
+  <h1>$title</h1>
+  $summary_html
+""")
+
+_REPORT_FOOT = """
+</div>
+</body>
+</html>"""
+
+_FAIL_ITEM_HTML = (
+    "<li class='rubric-item rubric-fail'>"
+    "<span class='icon'>&#10007;</span> {}</li>"
+)
+_PASS_ITEM_HTML = (
+    "<li class='rubric-item rubric-pass'>"
+    "<span class='icon'>&#10003;</span> {}</li>"
+)
+
+# Score badge class by bin: [0, 0.4) low, [0.4, 0.7) medium, [0.7, 1] high
+_SCORE_BINS = (0.4, 0.7)
+_SCORE_CLASSES = ("score-low", "score-medium", "score-high")
+# Indexed by `score >= 0.7`: expand attempts that fell short
+_OPEN_ATTR = ("open", "")
+
+
+def _product_image_uris(product: dict) -> list[str]:
+    """Return the reference and attempt image URIs shown for a product."""
+    uris = [product["reference_uri"]] if product.get("reference_uri") else []
+    uris.extend(
+        entry["image_uri"]
+        for entry in product.get("evaluation_history", [])
+        if entry.get("image_uri")
+    )
+    return uris
+
+
+def _build_product_section(
+    product: dict, images: dict[str, tuple[str | None, str | None]]
+) -> str:
+    """Build the HTML section for a single product in the batch report.
+
+    *images* holds the prefetched (base64_data, mime_type) for each URI.
+    """
     sku_id = product.get("sku_id", "unknown")
     description = product.get("description", "")
     reference_uri = product.get("reference_uri", "")
@@ -475,10 +985,19 @@ def _build_product_section(product: dict) -> str:
     passed = product.get("passed", False)
     error = product.get("error")
 
+    # The same rubric text usually repeats across attempts; escape it once
+    escaped: dict[str, str] = {}
+
+    def _esc(value) -> str:
+        text = str(value)
+        if text not in escaped:
+            escaped[text] = html_mod.escape(text)
+        return escaped[text]
+
     # Reference image
     ref_img_html = ""
     if reference_uri:
-        b64_data, mime_type = image_to_base64(reference_uri)
+        b64_data, mime_type = images.get(reference_uri, (None, None))
         if b64_data:
             name = reference_uri.split("/")[-1]
             ref_img_html = (
@@ -492,7 +1011,7 @@ def _build_product_section(product: dict) -> str:
             )
 
     # Attempts
-    attempts_html = ""
+    attempts_parts: list[str] = []
     for entry in history:
         attempt_num = entry["attempt"]
         score = entry["score"]
@@ -500,15 +1019,11 @@ def _build_product_section(product: dict) -> str:
         failing = entry.get("failing_verdicts", [])
         image_uri = entry.get("image_uri", "")
 
-        score_class = (
-            "score-high" if score >= 0.7
-            else "score-medium" if score >= 0.4
-            else "score-low"
-        )
+        score_class = _SCORE_CLASSES[bisect.bisect_right(_SCORE_BINS, score)]
 
         img_html = ""
         if image_uri:
-            b64_data, mime_type = image_to_base64(image_uri)
+            b64_data, mime_type = images.get(image_uri, (None, None))
             if b64_data:
                 img_html = (
                     f'<img src="data:{mime_type};base64,{b64_data}" '
@@ -516,23 +1031,16 @@ def _build_product_section(product: dict) -> str:
                     f'style="max-width:100%;border-radius:4px;border:1px solid #eee;">'
                 )
 
-        verdicts_html = "<ul class='rubric-list'>"
-        for v in failing:
-            verdicts_html += (
-                f"<li class='rubric-item rubric-fail'>"
-                f"<span class='icon'>&#10007;</span> {html_mod.escape(str(v))}</li>"
-            )
-        for v in passing:
-            verdicts_html += (
-                f"<li class='rubric-item rubric-pass'>"
-                f"<span class='icon'>&#10003;</span> {html_mod.escape(str(v))}</li>"
-            )
-        verdicts_html += "</ul>"
+        verdicts_parts = ["<ul class='rubric-list'>"]
+        verdicts_parts.extend(_FAIL_ITEM_HTML.format(_esc(v)) for v in failing)
+        verdicts_parts.extend(_PASS_ITEM_HTML.format(_esc(v)) for v in passing)
+        verdicts_parts.append("</ul>")
+        verdicts_html = "".join(verdicts_parts)
 
         total = len(passing) + len(failing)
-        open_attr = "open" if score < 0.7 else ""
+        open_attr = _OPEN_ATTR[score >= 0.7]
 
-        attempts_html += f"""
+        attempts_parts.append(f"""
         <details class="attempt" {open_attr}>
           <summary>
             <span class="attempt-label">Attempt {attempt_num}</span>
@@ -544,7 +1052,8 @@ def _build_product_section(product: dict) -> str:
             <div class="attempt-verdicts">{verdicts_html}</div>
           </div>
         </details>
-        """
+        """)
+    attempts_html = "".join(attempts_parts)
 
     final_score = history[-1]["score"] if history else 0.0
     if error:
@@ -572,7 +1081,11 @@ def _build_product_section(product: dict) -> str:
 
 
 def _generate_report(results: list[dict]) -> str:
-    """Generate the batch HTML report. Returns the file path."""
+    """Generate the batch HTML report. Returns the file path.
+
+    Images are fetched a few sections ahead of the one being written, so
+    only a small window of encoded images is held in memory at a time.
+    """
     if not results:
         return ""
 
@@ -613,63 +1126,49 @@ def _generate_report(results: list[dict]) -> str:
     </div>
     """
 
-    # Product sections (already sorted lowest first)
-    product_sections = [_build_product_section(r) for r in results]
-    sections_html = "\n<hr class='product-divider'>\n".join(product_sections)
-
-    html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<title>Batch Product Fidelity Report</title>
-<style>
-  body {{ font-family:'Segoe UI',Tahoma,Geneva,Verdana,sans-serif; margin:0; background:#f4f4f4; color:#333; }}
-  .container {{ max-width:1100px; margin:30px auto; background:#fff; padding:30px; border-radius:8px; box-shadow:0 2px 15px rgba(0,0,0,.08); }}
-  h1 {{ color:#1a73e8; margin-top:0; border-bottom:2px solid #eee; padding-bottom:10px; }}
-  .summary {{ margin-bottom:30px; padding:20px; background:#f8f9fa; border-radius:8px; }}
-  .summary h2 {{ margin-top:0; color:#333; }}
-  .summary-grid {{ display:flex; gap:16px; flex-wrap:wrap; }}
-  .summary-card {{ flex:1; min-width:120px; padding:16px; background:#fff; border-radius:8px; border-left:4px solid #1a73e8; text-align:center; }}
-  .summary-value {{ font-size:1.8em; font-weight:bold; color:#1a73e8; }}
-  .summary-label {{ font-size:0.85em; color:#666; margin-top:4px; }}
-  .product-section {{ margin-bottom:30px; }}
-  .product-header {{ margin-top:0; padding-bottom:8px; border-bottom:1px solid #eee; }}
-  .product-divider {{ border:none; border-top:3px solid #e0e0e0; margin:30px 0; }}
-  .meta {{ display:flex; gap:20px; margin-bottom:20px; background:#f8f9fa; padding:15px; border-radius:6px; }}
-  .meta-images {{ display:flex; gap:12px; flex-wrap:wrap; }}
-  .meta-prompt {{ flex:1; font-size:.9em; line-height:1.5; max-height:200px; overflow-y:auto; white-space:pre-wrap; background:#fff; padding:12px; border:1px solid #eee; border-radius:4px; }}
-  .attempt {{ border:1px solid #e0e0e0; border-radius:8px; margin-bottom:10px; overflow:hidden; }}
-  .attempt[open] {{ box-shadow:0 2px 8px rgba(0,0,0,.1); }}
-  .attempt summary {{ padding:14px 18px; background:#fafafa; cursor:pointer; display:flex; align-items:center; gap:12px; list-style:none; }}
-  .attempt summary::-webkit-details-marker {{ display:none; }}
-  .attempt-label {{ font-weight:600; }}
-  .attempt-content {{ display:flex; gap:20px; padding:18px; }}
-  .attempt-image {{ flex:0 0 250px; }}
-  .attempt-image img {{ max-width:100%; height:auto; }}
-  .attempt-verdicts {{ flex:1; }}
-  .score-badge {{ display:inline-block; padding:4px 12px; border-radius:14px; font-weight:bold; font-size:.9em; }}
-  .score-high {{ background:#e6f4ea; color:#188038; }}
-  .score-medium {{ background:#fef7e0; color:#b06000; }}
-  .score-low {{ background:#fce8e6; color:#d93025; }}
-  .stats {{ color:#666; font-size:.85em; }}
-  .rubric-list {{ list-style:none; padding:0; margin:0; }}
-  .rubric-item {{ margin-bottom:5px; padding:8px 10px; border-left:4px solid; border-radius:3px; font-size:.9em; }}
-  .rubric-pass {{ border-color:#188038; background:#f6fef7; }}
-  .rubric-fail {{ border-color:#d93025; background:#fef7f6; }}
-  .icon {{ margin-right:6px; }}
-</style>
-</head>
-<body>
-<div class="container">
-  <h1>Batch Product Fidelity Report</h1>
-  {summary_html}
-  {sections_html}
-</div>
-</body>
-</html>"""
+    head_html = _REPORT_HEAD.substitute(
+        title="Batch Product Fidelity Report", summary_html=summary_html
+    )
 
+    # Write product sections (already sorted lowest first) one at a time so
+    # the full report is never held in memory as a single string. Written
+    # to a uniquely named temp file and swapped in, so the server never
+    # serves a partial report and concurrent runs don't share a temp file.
     filename = "batch_report.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)), suffix=".html.tmp"
+    )
+    try:
+        os.fchmod(fd, report_file_mode(filename))
+        with ThreadPoolExecutor(max_workers=REPORT_PREFETCH_SECTIONS) as pool:
+
+            def _prefetch(product: dict) -> tuple[list[str], Future]:
+                # One batched etag lookup per section instead of one per image
+                uris = _product_image_uris(product)
+                return uris, pool.submit(
+                    images_to_base64_batch, uris,
+                    max_workers=REPORT_IMAGES_PER_SECTION,
+                )
+
+            window = collections.deque(
+                _prefetch(p) for p in results[:REPORT_PREFETCH_SECTIONS]
+            )
+            with open(fd, "w", encoding="utf-8", buffering=1 << 20) as f:
+                f.write(head_html)
+                for i, product in enumerate(results):
+                    ahead = i + REPORT_PREFETCH_SECTIONS
+                    if ahead < len(results):
+                        window.append(_prefetch(results[ahead]))
+                    uris, fut = window.popleft()
+                    images = dict(zip(uris, fut.result()))
+                    if i:
+                        f.write("\n<hr class='product-divider'>\n")
+                    f.write(_build_product_section(product, images))
+                f.write(_REPORT_FOOT)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_filename)
+        raise
 
     return filename
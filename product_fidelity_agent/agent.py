@@ -1,9 +1,13 @@
 from google.adk.agents import LoopAgent, SequentialAgent
 from google.adk.agents.llm_agent import LlmAgent
-from google.adk.tools.tool_context import ToolContext
 
 from .config import AGENT_MODEL, MAX_RETRIES, VIDEO_MAX_RETRIES
-from .callbacks import extract_uploaded_images, save_product_results, cleanup_image_data
+from .callbacks import (
+    extract_uploaded_images,
+    save_product_results,
+    cleanup_image_data,
+    start_first_image_generation,
+)
 from .agents.description_agent import description_agent
 from .agents.image_gen_agent import image_gen_agent
 from .agents.evaluation_agent import evaluation_agent
@@ -13,36 +17,7 @@ from .agents.refinement_agent import refinement_agent
 from .agents.report_agent import report_agent
 from .tools.gemini import refine_description, generate_description
 from .tools.reporting import create_html_report
-
-
-# --- Tool for input parsing ---
-
-def initialize_evaluation(
-    image_uris: str, sku_id: str, generation_type: str = "image",
-    tool_context: ToolContext = None,
-) -> dict:
-    """Initialize the product fidelity evaluation pipeline.
-
-    Args:
-        image_uris: Comma-separated GCS URIs of product reference images.
-        sku_id: Product SKU identifier.
-        generation_type: Either "image" (default) or "video".
-
-    Returns:
-        dict confirming initialization with the provided parameters.
-    """
-    tool_context.state["image_uris"] = image_uris
-    tool_context.state["sku_id"] = sku_id
-    tool_context.state["generation_type"] = generation_type
-    tool_context.state["attempt"] = 1
-    tool_context.state["evaluation_history"] = []
-    tool_context.state["evaluation_passed"] = False
-    return {
-        "status": "initialized",
-        "sku_id": sku_id,
-        "generation_type": generation_type,
-        "image_count": len([u for u in image_uris.split(",") if u.strip()]),
-    }
+from .tools.init import initialize_evaluation
 
 
 # --- Duplicate agents for the video pipeline ---
@@ -112,6 +87,7 @@ video_refinement_loop = LoopAgent(
 evaluation_pipeline = SequentialAgent(
     name="EvaluationPipeline",
     sub_agents=[description_agent, refinement_loop],
+    before_agent_callback=start_first_image_generation,
     after_agent_callback=save_product_results,
     description="Generates description and runs iterative image refinement for one product.",
 )
@@ -1,10 +1,43 @@
+import asyncio
 import re
+import sys
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from google.genai import types
 
-from .config import BUCKET_NAME
-from .tools.gcs import image_to_base64, write_to_gcs
+from .config import BUCKET_NAME, MAX_RETRIES
+from .tools.gcs import images_to_base64_batch, write_to_gcs
+from .tools.gemini import discard_prefetched_refinements
+from .tools.image_gen import discard_prefetched_images, prefetch_image
+
+# Markdown blocks appended to image-gen responses
+_REFERENCE_FMT = "\n\n**Reference:** {name}\n![{name}](data:{mime};base64,{b64})\n".format
+_CANDIDATE_FMT = (
+    "\n\n**Candidate (attempt {attempt}):**\n"
+    "![candidate_image](data:{mime};base64,{b64})\n"
+).format
+
+# Rendered candidate block by (candidate_uri, attempt), so repeat invocations
+# for the same attempt skip the fetch and encode. Kept in-process rather than
+# in session state, which ADK persists. Bounded to one product's attempts.
+_candidate_text_cache: dict[tuple[str, int], str] = {}
+
+# Inline base64 markdown image, as injected by inject_generated_image.
+# An unterminated blob makes a backtracking engine walk back through every
+# base64 character; RE2 (or a possessive run on 3.11+) stays linear.
+try:
+    import re2 as _re_engine
+
+    _B64_RUN = "+"
+except ImportError:
+    _re_engine = re
+    _B64_RUN = "++" if sys.version_info >= (3, 11) else "+"
+
+_IMG_RE = _re_engine.compile(
+    r"!\[[^\]]*\]\(data:image/"
+    r"(?:jpeg|png|gif|bmp|webp);base64,[A-Za-z0-9+/=\s]" + _B64_RUN + r"\)"
+)
 
 
 def _get_text(llm_response):
@@ -15,7 +48,32 @@ def _get_text(llm_response):
     return "".join(texts) if texts else None
 
 
-def inject_generated_image(callback_context, llm_response):
+async def _fetch_images(uris: list[str]) -> dict[str, tuple[str | None, str | None]]:
+    """Fetch and base64-encode GCS images concurrently, off the event loop.
+
+    Returns a map of URI -> (base64_data, mime_type).
+    """
+    uris = list(dict.fromkeys(uris))
+    encoded = await asyncio.to_thread(images_to_base64_batch, uris)
+    return dict(zip(uris, encoded))
+
+
+def _reference_parts(
+    uris: list[str], images: dict[str, tuple[str | None, str | None]]
+) -> list[types.Part]:
+    """Build the "Reference" markdown parts for the fetched reference images."""
+    parts = []
+    for uri in uris:
+        b64_data, mime_type = images[uri]
+        if b64_data:
+            name = uri.split("/")[-1]
+            parts.append(
+                types.Part(text=_REFERENCE_FMT(name=name, mime=mime_type, b64=b64_data))
+            )
+    return parts
+
+
+async def inject_generated_image(callback_context, llm_response):
     """after_model_callback: inject candidate image as base64 markdown into the response.
 
     Reads the candidate_image_uri from state (set by generate_product_image tool),
@@ -32,36 +90,39 @@ def inject_generated_image(callback_context, llm_response):
     parts_to_append = []
 
     # On first attempt, show the original reference image(s)
-    if not callback_context.state.get("_reference_images_shown"):
-        image_uris = callback_context.state.get("image_uris", "")
-        uris = [u.strip() for u in image_uris.split(",") if u.strip()]
-        for uri in uris:
-            b64_data, mime_type = image_to_base64(uri)
-            if b64_data:
-                name = uri.split("/")[-1]
-                md = f"![{name}](data:{mime_type};base64,{b64_data})"
-                parts_to_append.append(
-                    types.Part(text=f"\n\n**Reference:** {name}\n{md}\n")
-                )
+    show_references = not callback_context.state.get("_reference_images_shown")
+    uris = []
+    if show_references:
+        uris = list(callback_context.state.get("image_uri_list", ()))
+    candidate_uri = callback_context.state.get("candidate_image_uri")
+    attempt = callback_context.state.get("attempt", 1)
+    candidate_text = _candidate_text_cache.get((candidate_uri, attempt))
+
+    # Fetch references and the candidate together so GCS round trips overlap
+    fetch_candidate = candidate_uri and candidate_text is None
+    images = await _fetch_images(uris + [candidate_uri] if fetch_candidate else uris)
+
+    if show_references:
+        parts_to_append.extend(_reference_parts(uris, images))
         callback_context.state["_reference_images_shown"] = True
 
     # Inject the candidate image
-    candidate_uri = callback_context.state.get("candidate_image_uri")
-    if candidate_uri:
-        b64_data, mime_type = image_to_base64(candidate_uri)
+    if fetch_candidate:
+        b64_data, mime_type = images[candidate_uri]
         if b64_data:
-            markdown_img = f"![candidate_image](data:{mime_type};base64,{b64_data})"
-            attempt = callback_context.state.get("attempt", 1)
-            parts_to_append.append(
-                types.Part(text=f"\n\n**Candidate (attempt {attempt}):**\n{markdown_img}\n")
-            )
+            candidate_text = _CANDIDATE_FMT(attempt=attempt, mime=mime_type, b64=b64_data)
+            _candidate_text_cache[(candidate_uri, attempt)] = candidate_text
+            while len(_candidate_text_cache) > MAX_RETRIES:
+                _candidate_text_cache.pop(next(iter(_candidate_text_cache)))
+    if candidate_text:
+        parts_to_append.append(types.Part(text=candidate_text))
 
     for part in parts_to_append:
         llm_response.content.parts.append(part)
     return None
 
 
-def inject_generated_video(callback_context, llm_response):
+async def inject_generated_video(callback_context, llm_response):
     """after_model_callback: inject candidate video URI as text into the response.
 
     Reads the candidate_video_uri from state (set by generate_product_video tool)
@@ -78,16 +139,8 @@ def inject_generated_video(callback_context, llm_response):
 
     # On first attempt, show the original reference image(s)
     if not callback_context.state.get("_reference_images_shown"):
-        image_uris = callback_context.state.get("image_uris", "")
-        uris = [u.strip() for u in image_uris.split(",") if u.strip()]
-        for uri in uris:
-            b64_data, mime_type = image_to_base64(uri)
-            if b64_data:
-                name = uri.split("/")[-1]
-                md = f"![{name}](data:{mime_type};base64,{b64_data})"
-                parts_to_append.append(
-                    types.Part(text=f"\n\n**Reference:** {name}\n{md}\n")
-                )
+        uris = list(callback_context.state.get("image_uri_list", ()))
+        parts_to_append.extend(_reference_parts(uris, await _fetch_images(uris)))
         callback_context.state["_reference_images_shown"] = True
 
     # Inject the candidate video URI as text
@@ -113,29 +166,65 @@ def extract_uploaded_images(callback_context, llm_request):
     inline data with a text placeholder containing the GCS URI, so the
     root agent can parse and use it like any other GCS URI.
     """
+    # First pass: assign a GCS URI to every inline image
+    uploads = []  # (content, part_index, data, gcs_uri)
     for content in llm_request.contents:
         if content.role != "user":
             continue
-        new_parts = []
-        for part in content.parts:
-            if hasattr(part, "inline_data") and part.inline_data is not None:
-                data = part.inline_data.data
-                mime = part.inline_data.mime_type or "image/png"
+        for i, part in enumerate(content.parts):
+            inline = getattr(part, "inline_data", None)
+            if inline is not None:
+                mime = inline.mime_type or "image/png"
                 ext = mime.split("/")[-1]
                 if ext == "jpeg":
                     ext = "jpg"
                 filename = f"{uuid.uuid4().hex[:8]}.{ext}"
                 gcs_uri = f"gs://{BUCKET_NAME}/uploads/{filename}"
-                write_to_gcs(data, gcs_uri)
-                new_parts.append(
-                    types.Part(text=f"[Uploaded image saved to: {gcs_uri}]")
-                )
-            else:
-                new_parts.append(part)
-        content.parts = new_parts
+                uploads.append((content, i, inline.data, gcs_uri))
+
+    if not uploads:
+        return None
+
+    # Upload concurrently; list() waits for all writes and surfaces errors
+    with ThreadPoolExecutor(max_workers=min(8, len(uploads))) as executor:
+        list(executor.map(lambda u: write_to_gcs(u[2], u[3]), uploads))
+
+    # Second pass: swap each inline image for its GCS URI placeholder
+    for content, i, _, gcs_uri in uploads:
+        content.parts[i] = types.Part(text=f"[Uploaded image saved to: {gcs_uri}]")
     return None
 
 
+def start_first_image_generation(callback_context):
+    """before_agent_callback: kick off attempt 1 image generation early.
+
+    The first candidate doesn't depend on the ground-truth description, so
+    it is generated in the background while DescriptionAgent runs and
+    adopted by generate_product_image on attempt 1.
+    """
+    if callback_context.state.get("generation_type", "image") != "image":
+        return None
+    prefetch_image(callback_context, attempt=1)
+    return None
+
+
+# Immutable per-product state defaults restored by save_product_results
+_PER_PRODUCT_RESET = {
+    "sku_id": None,
+    "image_uris": None,
+    "ground_truth_description": None,
+    "current_description": None,
+    "evaluation_passed": False,
+    "attempt": 1,
+    "gecko_score": None,
+    "rubric_verdicts": None,
+    "failing_verdicts_text": None,
+    "candidate_image_uri": None,
+    "candidate_video_uri": None,
+    "_reference_images_shown": False,
+}
+
+
 def save_product_results(callback_context):
     """after_agent_callback: save evaluation results and reset per-product state.
 
@@ -153,20 +242,17 @@ def save_product_results(callback_context):
     })
     callback_context.state["all_products"] = all_products
 
-    # Reset per-product state for next iteration
-    callback_context.state["sku_id"] = None
-    callback_context.state["image_uris"] = None
-    callback_context.state["ground_truth_description"] = None
-    callback_context.state["current_description"] = None
-    callback_context.state["evaluation_history"] = []
-    callback_context.state["evaluation_passed"] = False
-    callback_context.state["attempt"] = 1
-    callback_context.state["gecko_score"] = None
-    callback_context.state["rubric_verdicts"] = None
-    callback_context.state["failing_verdicts_text"] = None
-    callback_context.state["candidate_image_uri"] = None
-    callback_context.state["candidate_video_uri"] = None
-    callback_context.state["_reference_images_shown"] = False
+    # Any prefetched work not adopted by now belongs to this product
+    discard_prefetched_images(callback_context.session.id)
+    discard_prefetched_refinements(callback_context.session.id)
+
+    # Reset per-product state for next iteration in one write. The lists are
+    # fresh each time since tools append to evaluation_history in place.
+    callback_context.state.update({
+        **_PER_PRODUCT_RESET,
+        "image_uri_list": [],
+        "evaluation_history": [],
+    })
 
     return None
 
@@ -177,12 +263,14 @@ def cleanup_image_data(callback_context, llm_request):
     Replaces inline base64 markdown images with lightweight placeholder tags
     to prevent token bloat if conversation history is ever included.
     """
-    pattern = (
-        r"!\[[^\]]*\]\(data:image/"
-        r"(?:jpeg|png|gif|bmp|webp);base64,[A-Za-z0-9+/=\s]+\)"
-    )
     for content in llm_request.contents:
         for part in content.parts:
-            if hasattr(part, "text") and part.text:
-                part.text = re.sub(pattern, "[image]", part.text)
+            # Cheap substring check skips the regex for text without images
+            text = getattr(part, "text", None)
+            if text and "data:image/" in text:
+                # sub() already splices matches in one C-level pass; only
+                # reassign (and copy) when something was actually replaced
+                stripped, count = _IMG_RE.subn("[image]", text)
+                if count:
+                    part.text = stripped
     return None
@@ -21,3 +21,8 @@ VIDEO_MAX_RETRIES = 3  # configurable retry count for video refinement loop
 # --- Evaluation Thresholds ---
 PASSING_THRESHOLD = 0.7
 MAX_RETRIES = 3
+
+# --- Batch Pipeline ---
+PIPELINE_CONCURRENCY = int(os.environ.get("PIPELINE_CONCURRENCY", "5"))
+# Generate the next attempt while the current one is evaluated (2x peak image-gen QPS)
+SPECULATIVE_GENERATION = os.environ.get("SPECULATIVE_GENERATION", "false").lower() == "true"
@@ -3,3 +3,4 @@ from .image_gen import generate_product_image
 from .video_gen import generate_product_video
 from .gecko import run_gecko_evaluation, run_gecko_video_evaluation, check_threshold
 from .reporting import create_html_report
+from .init import initialize_evaluation
@@ -1,3 +1,7 @@
+import logging
+import operator
+import random
+import threading
 import time
 
 import pandas as pd
@@ -7,9 +11,61 @@ from google.genai.errors import ClientError
 from google.adk.tools.tool_context import ToolContext
 
 from ..config import PROJECT_ID, LOCATION, PASSING_THRESHOLD, MAX_RETRIES
+from .gemini import prefetch_refinement
+
+logger = logging.getLogger(__name__)
 
 RUBRIC_MAX_RETRIES = 3
-RUBRIC_RETRY_DELAY = 10  # seconds
+RUBRIC_MAX_RETRY_DELAY = 60  # seconds
+
+
+def rubric_retry_delay(rubric_attempt: int, error: ClientError | None = None) -> float:
+    """Seconds to wait before retrying rubric generation.
+
+    Honors a Retry-After header on a rate-limit error; otherwise uses
+    exponential backoff with jitter, capped at RUBRIC_MAX_RETRY_DELAY.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(RUBRIC_MAX_RETRY_DELAY, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return min(RUBRIC_MAX_RETRY_DELAY, 2 ** rubric_attempt + random.uniform(0, 1))
+
+
+_vertex_client: VertexClient | None = None
+_vertex_client_lock = threading.Lock()
+
+
+def _get_vertex_client() -> VertexClient:
+    """Shared Vertex client, built once on first use."""
+    global _vertex_client
+    if _vertex_client is None:
+        with _vertex_client_lock:
+            if _vertex_client is None:
+                _vertex_client = VertexClient(project=PROJECT_ID, location=LOCATION)
+    return _vertex_client
+
+
+_verdict_text = operator.attrgetter("evaluated_rubric.content.property.description")
+
+
+def _safe_verdict_text(v) -> str:
+    try:
+        return _verdict_text(v)
+    except AttributeError:
+        return str(v)
+
+
+def split_verdicts(verdicts) -> tuple[list[str], list[str]]:
+    """Split rubric verdicts into (passing, failing) rubric texts."""
+    flags = [str(getattr(v, "verdict", False)).lower() == "true" for v in verdicts]
+    texts = [_safe_verdict_text(v) for v in verdicts]
+    passing = [t for t, f in zip(texts, flags) if f]
+    failing = [t for t, f in zip(texts, flags) if not f]
+    return passing, failing
 
 
 def run_gecko_evaluation(
@@ -24,7 +80,7 @@ def run_gecko_evaluation(
     Returns:
         dict with score, verdict counts, and lists of passing/failing verdicts.
     """
-    vertex_client = VertexClient(project=PROJECT_ID, location=LOCATION)
+    vertex_client = _get_vertex_client()
 
     response_data = {
         "parts": [
@@ -32,8 +88,11 @@ def run_gecko_evaluation(
         ],
         "role": "model",
     }
-    eval_dataset = pd.DataFrame(
-        {"prompt": [prompt], "response": [response_data]}
+    # generate_rubrics needs a DataFrame; from_records with fixed columns
+    # skips the dict-of-lists dtype inference for this single row
+    eval_dataset = pd.DataFrame.from_records(
+        [{"prompt": prompt, "response": response_data}],
+        columns=["prompt", "response"],
     )
 
     # Generate rubrics with retry on rate-limit (429) errors
@@ -59,20 +118,22 @@ def run_gecko_evaluation(
             ):
                 break
             # Rubrics came back empty — treat as a transient failure
-            print(
-                f"Rubric generation returned empty results "
-                f"(attempt {rubric_attempt}/{RUBRIC_MAX_RETRIES}), retrying..."
+            logger.warning(
+                "Rubric generation returned empty results "
+                "(attempt %d/%d), retrying...",
+                rubric_attempt, RUBRIC_MAX_RETRIES,
             )
             if rubric_attempt < RUBRIC_MAX_RETRIES:
-                time.sleep(RUBRIC_RETRY_DELAY)
+                time.sleep(rubric_retry_delay(rubric_attempt))
         except ClientError as e:
             if e.status_code == 429 and rubric_attempt < RUBRIC_MAX_RETRIES:
-                print(
-                    f"Rubric generation rate-limited "
-                    f"(attempt {rubric_attempt}/{RUBRIC_MAX_RETRIES}), "
-                    f"retrying in {RUBRIC_RETRY_DELAY}s..."
+                delay = rubric_retry_delay(rubric_attempt, e)
+                logger.warning(
+                    "Rubric generation rate-limited (attempt %d/%d), "
+                    "retrying in %.1fs...",
+                    rubric_attempt, RUBRIC_MAX_RETRIES, delay,
                 )
-                time.sleep(RUBRIC_RETRY_DELAY)
+                time.sleep(delay)
             else:
                 raise
 
@@ -104,20 +165,7 @@ def run_gecko_evaluation(
 
     score = score if score is not None else 0.0
 
-    passing = []
-    failing = []
-    if verdicts:
-        for v in verdicts:
-            raw_verdict = getattr(v, "verdict", False)
-            is_pass = str(raw_verdict).lower() == "true"
-            try:
-                text = v.evaluated_rubric.content.property.description
-            except AttributeError:
-                text = str(v)
-            if is_pass:
-                passing.append(text)
-            else:
-                failing.append(text)
+    passing, failing = split_verdicts(verdicts or ())
 
     # Store in state
     tool_context.state["gecko_score"] = score
@@ -129,6 +177,11 @@ def run_gecko_evaluation(
         f"- {v}" for v in failing
     )
 
+    # check_threshold will ask for a retry; start the refinement now so it
+    # overlaps the remaining agent turns
+    if score < PASSING_THRESHOLD and tool_context.state.get("attempt", 1) < MAX_RETRIES:
+        prefetch_refinement(tool_context)
+
     # Track history across attempts
     history = tool_context.state.get("evaluation_history", [])
     history.append(
@@ -164,7 +217,7 @@ def run_gecko_video_evaluation(
     Returns:
         dict with score, verdict counts, and lists of passing/failing verdicts.
     """
-    vertex_client = VertexClient(project=PROJECT_ID, location=LOCATION)
+    vertex_client = _get_vertex_client()
 
     response_data = {
         "parts": [
@@ -172,8 +225,11 @@ def run_gecko_video_evaluation(
         ],
         "role": "model",
     }
-    eval_dataset = pd.DataFrame(
-        {"prompt": [prompt], "response": [response_data]}
+    # generate_rubrics needs a DataFrame; from_records with fixed columns
+    # skips the dict-of-lists dtype inference for this single row
+    eval_dataset = pd.DataFrame.from_records(
+        [{"prompt": prompt, "response": response_data}],
+        columns=["prompt", "response"],
     )
 
     # Generate rubrics with retry on rate-limit (429) errors
@@ -196,20 +252,22 @@ def run_gecko_video_evaluation(
                 and df["rubric_groups"].iloc[0]
             ):
                 break
-            print(
-                f"Rubric generation returned empty results "
-                f"(attempt {rubric_attempt}/{RUBRIC_MAX_RETRIES}), retrying..."
+            logger.warning(
+                "Rubric generation returned empty results "
+                "(attempt %d/%d), retrying...",
+                rubric_attempt, RUBRIC_MAX_RETRIES,
             )
             if rubric_attempt < RUBRIC_MAX_RETRIES:
-                time.sleep(RUBRIC_RETRY_DELAY)
+                time.sleep(rubric_retry_delay(rubric_attempt))
         except ClientError as e:
             if e.status_code == 429 and rubric_attempt < RUBRIC_MAX_RETRIES:
-                print(
-                    f"Rubric generation rate-limited "
-                    f"(attempt {rubric_attempt}/{RUBRIC_MAX_RETRIES}), "
-                    f"retrying in {RUBRIC_RETRY_DELAY}s..."
+                delay = rubric_retry_delay(rubric_attempt, e)
+                logger.warning(
+                    "Rubric generation rate-limited (attempt %d/%d), "
+                    "retrying in %.1fs...",
+                    rubric_attempt, RUBRIC_MAX_RETRIES, delay,
                 )
-                time.sleep(RUBRIC_RETRY_DELAY)
+                time.sleep(delay)
             else:
                 raise
 
@@ -239,20 +297,7 @@ def run_gecko_video_evaluation(
 
     score = score if score is not None else 0.0
 
-    passing = []
-    failing = []
-    if verdicts:
-        for v in verdicts:
-            raw_verdict = getattr(v, "verdict", False)
-            is_pass = str(raw_verdict).lower() == "true"
-            try:
-                text = v.evaluated_rubric.content.property.description
-            except AttributeError:
-                text = str(v)
-            if is_pass:
-                passing.append(text)
-            else:
-                failing.append(text)
+    passing, failing = split_verdicts(verdicts or ())
 
     # Store in state (same keys as image evaluation)
     tool_context.state["gecko_score"] = score
@@ -264,6 +309,11 @@ def run_gecko_video_evaluation(
         f"- {v}" for v in failing
     )
 
+    # check_threshold will ask for a retry; start the refinement now so it
+    # overlaps the remaining agent turns
+    if score < PASSING_THRESHOLD and tool_context.state.get("attempt", 1) < MAX_RETRIES:
+        prefetch_refinement(tool_context)
+
     # Track history across attempts
     history = tool_context.state.get("evaluation_history", [])
     history.append(
@@ -1,19 +1,28 @@
+import functools
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from google import genai
 from google.genai import types
 from google.adk.tools.tool_context import ToolContext
 
-from ..config import PROJECT_ID, LOCATION, DESCRIPTION_MODEL
+from ..config import DESCRIPTION_MODEL
+from .genai_client import get_client
+from .image_gen import prefetch_image
 
 _PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "prompts")
 
 
+@functools.lru_cache(maxsize=None)
 def _load_prompt(filename: str) -> str:
     with open(os.path.join(_PROMPTS_DIR, filename)) as f:
         return f.read()
 
 
+def _image_mime(uri: str) -> str:
+    ext = uri.rpartition(".")[2].lower()
+    return "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
+
+
 def generate_description(image_uris: str, tool_context: ToolContext) -> dict:
     """Generate a ground-truth product description from reference images.
 
@@ -23,31 +32,15 @@ def generate_description(image_uris: str, tool_context: ToolContext) -> dict:
     Returns:
         dict with 'description' containing the generated ground-truth text.
     """
-    client = genai.Client(
-        vertexai=True,
-        project=PROJECT_ID,
-        location=LOCATION,
-        http_options=types.HttpOptions(
-            timeout=60 * 1000,
-            retry_options=types.HttpRetryOptions(
-                attempts=5,
-                initial_delay=1.0,
-                jitter=0.3,
-                max_delay=20.0,
-                http_status_codes=[408, 429, 500, 502, 503, 504],
-            ),
-        ),
-    )
+    client = get_client()
 
     system_instruction = _load_prompt("description_system.txt")
     user_prompt = _load_prompt("description_user.txt")
 
     uris = [u.strip() for u in image_uris.split(",")]
-    content_parts = []
-    for uri in uris:
-        ext = uri.lower().rsplit(".", 1)[-1]
-        mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
-        content_parts.append(types.Part.from_uri(file_uri=uri, mime_type=mime))
+    content_parts = [
+        types.Part.from_uri(file_uri=uri, mime_type=_image_mime(uri)) for uri in uris
+    ]
     content_parts.append(user_prompt)
 
     response = client.models.generate_content(
@@ -67,36 +60,19 @@ def generate_description(image_uris: str, tool_context: ToolContext) -> dict:
     return {"status": "success", "description": description}
 
 
-def refine_description(
-    original_description: str, failing_verdicts: str, tool_context: ToolContext
-) -> dict:
-    """Refine a product description to emphasize attributes that failed evaluation.
+# Refinements started early by run_gecko_evaluation, keyed by
+# (session_id, attempt) and stored with the (original, failing verdicts)
+# inputs they were started for. Entries are dropped when the product's
+# results are saved; the cap only guards against sessions that never get
+# that far. Future.cancel() only stops a refinement that hasn't started.
+_REFINE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+_PENDING_REFINEMENTS: dict[tuple[str, int], tuple[tuple[str, str], Future]] = {}
+_MAX_PENDING_REFINEMENTS = 32
 
-    Always derives from the original description (not previous refinements)
-    to prevent drift across iterations.
 
-    Args:
-        original_description: The original ground-truth description.
-        failing_verdicts: Newline-separated list of failing rubric verdicts.
-
-    Returns:
-        dict with 'refined_description' containing the updated text.
-    """
-    client = genai.Client(
-        vertexai=True,
-        project=PROJECT_ID,
-        location=LOCATION,
-        http_options=types.HttpOptions(
-            timeout=60 * 1000,
-            retry_options=types.HttpRetryOptions(
-                attempts=5,
-                initial_delay=1.0,
-                jitter=0.3,
-                max_delay=20.0,
-                http_status_codes=[408, 429, 500, 502, 503, 504],
-            ),
-        ),
-    )
+def _refine(original_description: str, failing_verdicts: str) -> str:
+    """Call Gemini to refine *original_description*; returns the refined text."""
+    client = get_client()
 
     refinement_prompt = f"""You are refining a product description for text-to-image generation.
 
@@ -122,11 +98,81 @@ Your task: Rewrite the description to MORE STRONGLY EMPHASIZE the failing attrib
         contents=refinement_prompt,
         config=types.GenerateContentConfig(temperature=0.7),
     )
+    return response.text
 
-    refined = response.text
-    tool_context.state["current_description"] = refined
 
+def _refinement_inputs(
+    state, original_description: str = "", failing_verdicts: str = ""
+) -> tuple[str, str]:
+    """(original description, failing verdicts) to refine, read from state.
+
+    The tool arguments are only a fallback: state holds the exact text, so
+    a refinement never depends on the LLM echoing it back unchanged.
+    """
+    return (
+        (state.get("ground_truth_description") or original_description).strip(),
+        (state.get("failing_verdicts_text") or failing_verdicts).strip(),
+    )
+
+
+def prefetch_refinement(tool_context: ToolContext) -> None:
+    """Start refining in the background so refine_description can adopt the result.
+
+    Called once an evaluation is known to need a retry, which lets the
+    refinement call overlap the remaining evaluation/refinement agent turns.
+    """
+    key = (tool_context.session.id, tool_context.state.get("attempt", 1))
+    inputs = _refinement_inputs(tool_context.state)
+    if not inputs[0] or key in _PENDING_REFINEMENTS:
+        return
+    while len(_PENDING_REFINEMENTS) >= _MAX_PENDING_REFINEMENTS:
+        _PENDING_REFINEMENTS.pop(next(iter(_PENDING_REFINEMENTS)))[1].cancel()
+    _PENDING_REFINEMENTS[key] = (inputs, _REFINE_EXECUTOR.submit(_refine, *inputs))
+
+
+def discard_prefetched_refinements(session_id: str) -> None:
+    """Drop any prefetched refinements for *session_id* that weren't adopted."""
+    for key in [k for k in _PENDING_REFINEMENTS if k[0] == session_id]:
+        _PENDING_REFINEMENTS.pop(key)[1].cancel()
+
+
+def refine_description(
+    original_description: str, failing_verdicts: str, tool_context: ToolContext
+) -> dict:
+    """Refine a product description to emphasize attributes that failed evaluation.
+
+    Always derives from the original description (not previous refinements)
+    to prevent drift across iterations. The ground-truth description and
+    failing verdicts in session state take precedence over the arguments.
+
+    Args:
+        original_description: The original ground-truth description.
+        failing_verdicts: Newline-separated list of failing rubric verdicts.
+
+    Returns:
+        dict with 'refined_description' containing the updated text.
+    """
     attempt = tool_context.state.get("attempt", 1)
+    inputs = _refinement_inputs(
+        tool_context.state, original_description, failing_verdicts
+    )
+
+    # Adopt this session's prefetched refinement for this attempt, if it
+    # was started from the same state
+    pending = _PENDING_REFINEMENTS.pop((tool_context.session.id, attempt), None)
+    if pending is not None and pending[0] == inputs:
+        refined = pending[1].result()
+    else:
+        if pending is not None:
+            pending[1].cancel()
+        refined = _refine(*inputs)
+
+    tool_context.state["current_description"] = refined
     tool_context.state["attempt"] = attempt + 1
 
+    # The next image only needs the refinement and the failing verdicts, both
+    # now in state, so start it rather than wait for ImageGenAgent's next turn
+    if tool_context.state.get("generation_type", "image") == "image":
+        prefetch_image(tool_context, attempt + 1)
+
     return {"status": "success", "refined_description": refined}
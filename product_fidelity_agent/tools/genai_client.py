@@ -0,0 +1,33 @@
+import threading
+
+from google import genai
+from google.genai import types
+
+from ..config import PROJECT_ID, LOCATION
+
+_client: genai.Client | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> genai.Client:
+    """Shared Gemini client; the retry/timeout options are static."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = genai.Client(
+                    vertexai=True,
+                    project=PROJECT_ID,
+                    location=LOCATION,
+                    http_options=types.HttpOptions(
+                        timeout=60 * 1000,
+                        retry_options=types.HttpRetryOptions(
+                            attempts=5,
+                            initial_delay=1.0,
+                            jitter=0.3,
+                            max_delay=20.0,
+                            http_status_codes=[408, 429, 500, 502, 503, 504],
+                        ),
+                    ),
+                )
+    return _client
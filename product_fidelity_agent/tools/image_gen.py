@@ -1,11 +1,12 @@
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from google import genai
 from google.genai import types
 from google.adk.tools.tool_context import ToolContext
 
-from ..config import PROJECT_ID, LOCATION, IMAGE_GEN_MODEL, BUCKET_NAME
+from ..config import IMAGE_GEN_MODEL, BUCKET_NAME
 from .gcs import write_to_gcs
+from .genai_client import get_client
 
 
 RECONTEXTUALIZATION_PROMPT = (
@@ -23,57 +24,49 @@ RECONTEXTUALIZATION_PROMPT = (
 )
 
 
-def generate_product_image(tool_context: ToolContext) -> dict:
-    """Generate a recontextualized product image from the original product reference image(s).
+# Generations started before ImageGenAgent asks for them, keyed by
+# (session_id, attempt) and stored with the (reference URIs, sku_id, prompt)
+# they were started for, so a session only ever adopts its own image and
+# only if its inputs still match. Entries are dropped when the product's
+# results are saved; the cap only guards against sessions that never get
+# that far. A dropped generation that has already started still runs to
+# completion (and is paid for); Future.cancel() only stops queued ones.
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+_PENDING_IMAGES: dict[
+    tuple[str, int], tuple[tuple[tuple[str, ...], str, str], Future]
+] = {}
+_MAX_PENDING_IMAGES = 16
 
-    Takes the original product reference image(s) from state and places them
-    into a contextually appropriate background/setting.
 
-    Returns:
-        dict with 'image_uri' containing the GCS URI of the generated image.
-    """
-    client = genai.Client(
-        vertexai=True,
-        project=PROJECT_ID,
-        location=LOCATION,
-        http_options=types.HttpOptions(
-            timeout=60 * 1000,
-            retry_options=types.HttpRetryOptions(
-                attempts=5,
-                initial_delay=1.0,
-                jitter=0.3,
-                max_delay=20.0,
-                http_status_codes=[408, 429, 500, 502, 503, 504],
-            ),
-        ),
+def _prompt_for(attempt: int, refined: str, failing: str) -> str:
+    """Build the generation prompt for *attempt*."""
+    if attempt == 1:
+        return RECONTEXTUALIZATION_PROMPT
+    # On retries, augment the prompt with the refined description and
+    # the specific attributes that failed so the model can correct them.
+    return (
+        f"{RECONTEXTUALIZATION_PROMPT}\n\n"
+        f"IMPORTANT: A previous attempt failed fidelity checks. "
+        f"Pay extra attention to the following attributes that were NOT "
+        f"faithfully reproduced:\n{failing}\n\n"
+        f"Use this refined product description as guidance:\n{refined}"
     )
 
-    # Build multimodal contents: original product images + recontextualization prompt
-    image_uris = tool_context.state.get("image_uris", "")
-    uris = [u.strip() for u in image_uris.split(",") if u.strip()]
 
+def _generate(uris: list[str], prompt: str, sku_id: str, attempt: int) -> str | None:
+    """Generate an image from the references and prompt, upload it to GCS.
+
+    Returns the GCS URI, or None if the model returned no image.
+    """
+    client = get_client()
+
+    # Build multimodal contents: original product images + prompt
     content_parts = []
     for uri in uris:
-        ext = uri.lower().rsplit(".", 1)[-1]
+        ext = uri.rpartition(".")[2].lower()
         mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
         content_parts.append(types.Part.from_uri(file_uri=uri, mime_type=mime))
-
-    attempt = tool_context.state.get("attempt", 1)
-    if attempt > 1:
-        # On retries, augment the prompt with the refined description and
-        # the specific attributes that failed so the model can correct them.
-        refined = tool_context.state.get("current_description", "")
-        failing = tool_context.state.get("failing_verdicts_text", "")
-        retry_prompt = (
-            f"{RECONTEXTUALIZATION_PROMPT}\n\n"
-            f"IMPORTANT: A previous attempt failed fidelity checks. "
-            f"Pay extra attention to the following attributes that were NOT "
-            f"faithfully reproduced:\n{failing}\n\n"
-            f"Use this refined product description as guidance:\n{refined}"
-        )
-        content_parts.append(retry_prompt)
-    else:
-        content_parts.append(RECONTEXTUALIZATION_PROMPT)
+    content_parts.append(prompt)
 
     response = client.models.generate_content(
         model=IMAGE_GEN_MODEL,
@@ -85,17 +78,86 @@ def generate_product_image(tool_context: ToolContext) -> dict:
 
     for part in response.parts:
         if part.inline_data is not None:
-            image_bytes = part.inline_data.data
-            sku_id = tool_context.state.get("sku_id", "unknown")
-            attempt = tool_context.state.get("attempt", 1)
             image_id = str(uuid.uuid4())[:8]
             gcs_path = (
                 f"gs://{BUCKET_NAME}/generated/{sku_id}/"
                 f"attempt_{attempt}_{image_id}.png"
             )
+            write_to_gcs(part.inline_data.data, gcs_path)
+            return gcs_path
+    return None
+
+
+def _image_request(state, attempt: int) -> tuple[tuple[str, ...], str, str]:
+    """(reference URIs, sku_id, prompt) for *attempt*, read from session state.
+
+    Both prefetch_image and generate_product_image derive their inputs here,
+    so an adopted prefetch never depends on text echoed back by the LLM.
+    """
+    image_uris = state.get("image_uris") or ""
+    uris = tuple(u.strip() for u in image_uris.split(",") if u.strip())
+    prompt = _prompt_for(
+        attempt,
+        state.get("current_description") or "",
+        state.get("failing_verdicts_text") or "",
+    )
+    return uris, state.get("sku_id", "unknown"), prompt
+
+
+def prefetch_image(context, attempt: int) -> None:
+    """Start generating the candidate for *attempt* in the background.
+
+    *context* is the tool or callback context; the inputs are read from its
+    session state. Called as soon as those are known: for attempt 1 while
+    the ground-truth description is still being generated (it only needs
+    the references), and for retries as soon as refine_description has
+    stored the refinement. generate_product_image adopts the result for the
+    same session and attempt.
+    """
+    key = (context.session.id, attempt)
+    request = _image_request(context.state, attempt)
+    uris, sku_id, prompt = request
+    if not uris or key in _PENDING_IMAGES:
+        return
+    while len(_PENDING_IMAGES) >= _MAX_PENDING_IMAGES:
+        _PENDING_IMAGES.pop(next(iter(_PENDING_IMAGES)))[1].cancel()
+    _PENDING_IMAGES[key] = (
+        request,
+        _PREFETCH_EXECUTOR.submit(_generate, list(uris), prompt, sku_id, attempt),
+    )
+
+
+def discard_prefetched_images(session_id: str) -> None:
+    """Drop any prefetched generations for *session_id* that weren't adopted."""
+    for key in [k for k in _PENDING_IMAGES if k[0] == session_id]:
+        _PENDING_IMAGES.pop(key)[1].cancel()
+
+
+def generate_product_image(tool_context: ToolContext) -> dict:
+    """Generate a recontextualized product image from the original product reference image(s).
+
+    Takes the original product reference image(s) from state and places them
+    into a contextually appropriate background/setting.
+
+    Returns:
+        dict with 'image_uri' containing the GCS URI of the generated image.
+    """
+    attempt = tool_context.state.get("attempt", 1)
+    request = _image_request(tool_context.state, attempt)
+    uris, sku_id, prompt = request
+
+    # Adopt this session's prefetched generation for this attempt, unless
+    # the state it was started from has since changed; otherwise generate now
+    pending = _PENDING_IMAGES.pop((tool_context.session.id, attempt), None)
+    if pending is not None and pending[0] == request:
+        gcs_path = pending[1].result()
+    else:
+        if pending is not None:
+            pending[1].cancel()
+        gcs_path = _generate(list(uris), prompt, sku_id, attempt)
 
-            write_to_gcs(image_bytes, gcs_path)
-            tool_context.state["candidate_image_uri"] = gcs_path
-            return {"status": "success", "image_uri": gcs_path}
+    if gcs_path is None:
+        return {"status": "error", "message": "No image was generated by the model."}
 
-    return {"status": "error", "message": "No image was generated by the model."}
+    tool_context.state["candidate_image_uri"] = gcs_path
+    return {"status": "success", "image_uri": gcs_path}
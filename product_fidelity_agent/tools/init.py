@@ -0,0 +1,32 @@
+from google.adk.tools.tool_context import ToolContext
+
+
+def initialize_evaluation(
+    image_uris: str, sku_id: str, generation_type: str = "image",
+    tool_context: ToolContext = None,
+) -> dict:
+    """Initialize the product fidelity evaluation pipeline.
+
+    Args:
+        image_uris: Comma-separated GCS URIs of product reference images.
+        sku_id: Product SKU identifier.
+        generation_type: Either "image" (default) or "video".
+
+    Returns:
+        dict confirming initialization with the provided parameters.
+    """
+    # Parse once; callbacks read the list instead of re-splitting each attempt
+    uris = [u.strip() for u in image_uris.split(",") if u.strip()]
+    tool_context.state["image_uris"] = image_uris
+    tool_context.state["image_uri_list"] = uris
+    tool_context.state["sku_id"] = sku_id
+    tool_context.state["generation_type"] = generation_type
+    tool_context.state["attempt"] = 1
+    tool_context.state["evaluation_history"] = []
+    tool_context.state["evaluation_passed"] = False
+    return {
+        "status": "initialized",
+        "sku_id": sku_id,
+        "generation_type": generation_type,
+        "image_count": len(uris),
+    }
@@ -1,13 +1,132 @@
+import collections
+import contextlib
 import html
+import itertools
 import os
+import tempfile
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from urllib.parse import quote
 
 from google.adk.tools.tool_context import ToolContext
 
-from .gcs import image_to_base64, media_to_base64
+from .gcs import media_to_base64
 
 
-def _build_product_section(product: dict) -> str:
-    """Build the HTML section for a single product."""
+_REPORT_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>Product Fidelity Report</title>
+<style>
+  body { font-family:'Segoe UI',Tahoma,Geneva,Verdana,sans-serif; margin:0; background:#f4f4f4; color:#333; }
+  .container { max-width:1100px; margin:30px auto; background:#fff; padding:30px; border-radius:8px; box-shadow:0 2px 15px rgba(0,0,0,.08); }
+  h1 { color:#1a73e8; margin-top:0; border-bottom:2px solid #eee; padding-bottom:10px; }
+  .product-section { margin-bottom:30px; }
+  .product-header { margin-top:0; padding-bottom:8px; border-bottom:1px solid #eee; }
+  .product-divider { border:none; border-top:3px solid #e0e0e0; margin:30px 0; }
+  .meta { display:flex; gap:20px; margin-bottom:20px; background:#f8f9fa; padding:15px; border-radius:6px; }
+  .meta-images { display:flex; gap:12px; flex-wrap:wrap; }
+  .meta-prompt { flex:1; font-size:.9em; line-height:1.5; max-height:200px; overflow-y:auto; white-space:pre-wrap; background:#fff; padding:12px; border:1px solid #eee; border-radius:4px; }
+  .attempt { border:1px solid #e0e0e0; border-radius:8px; margin-bottom:10px; overflow:hidden; }
+  .attempt[open] { box-shadow:0 2px 8px rgba(0,0,0,.1); }
+  .attempt summary { padding:14px 18px; background:#fafafa; cursor:pointer; display:flex; align-items:center; gap:12px; list-style:none; }
+  .attempt summary::-webkit-details-marker { display:none; }
+  .attempt-label { font-weight:600; }
+  .attempt-content { display:flex; gap:20px; padding:18px; }
+  .attempt-image { flex:0 0 250px; }
+  .attempt-image img, .attempt-image video { max-width:100%; height:auto; }
+  .attempt-verdicts { flex:1; }
+  .score-badge { display:inline-block; padding:4px 12px; border-radius:14px; font-weight:bold; font-size:.9em; }
+  .score-high { background:#e6f4ea; color:#188038; }
+  .score-medium { background:#fef7e0; color:#b06000; }
+  .score-low { background:#fce8e6; color:#d93025; }
+  .stats { color:#666; font-size:.85em; }
+  .rubric-list { list-style:none; padding:0; margin:0; }
+  .rubric-item { margin-bottom:5px; padding:8px 10px; border-left:4px solid; border-radius:3px; font-size:.9em; }
+  .rubric-pass { border-color:#188038; background:#f6fef7; }
+  .rubric-fail { border-color:#d93025; background:#fef7f6; }
+  .icon { margin-right:6px; }
+  .placeholder { height:160px; display:flex; align-items:center; justify-content:center; background:#f0f0f0; border-radius:4px; font-size:.85em; color:#888; }
+</style>
+</head>
+<body>
+<div class="container">
+  <h1>Product Fidelity Report</h1>
+""".encode("utf-8")
+
+_REPORT_FOOT = b"""</div>
+</body>
+</html>"""
+
+_PRODUCT_DIVIDER = b"\n<hr class='product-divider'>\n"
+
+# Upper bound on concurrent GCS downloads across the whole report, within
+# the storage client's 32-connection pool
+_MEDIA_WORKERS = 16
+# Product sections built (or built and awaiting their turn to be written)
+# at once
+_SECTION_WORKERS = 8
+
+# Images are linked through the server's GCS proxy rather than inlined, so
+# the report stays small and the browser loads them lazily
+_THUMBNAIL_URL = "/api/gcs/thumbnail?uri="
+_VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm")
+_HTTP_SCHEMES = ("https://", "http://")
+
+
+_ATTEMPT_TEMPLATE = """
+        <details class="attempt" {open_attr}>
+          <summary>
+            <span class="attempt-label">Attempt {attempt_num}</span>
+            <span class="score-badge {score_class}">{score:.2f}</span>
+            <span class="stats">{n_passed}/{total} passed</span>
+          </summary>
+          <div class="attempt-content">
+            <div class="attempt-image">{img_html}</div>
+            <div class="attempt-verdicts">{verdicts_html}</div>
+          </div>
+        </details>
+        """.format
+
+_FAIL_ITEM = (
+    "<li class='rubric-item rubric-fail'><span class='icon'>&#10007;</span> "
+)
+_PASS_ITEM = (
+    "<li class='rubric-item rubric-pass'><span class='icon'>&#10003;</span> "
+)
+
+
+# Process umask, read once at import (os.umask can only be read by setting it)
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def report_file_mode(filename: str) -> int:
+    """Permissions for a report about to be swapped in over *filename*.
+
+    mkstemp creates its file as 0600, so without this the published report
+    would lose group/other read access. Keeps the existing report's mode,
+    or uses what a plain open() would give under the process umask.
+    """
+    try:
+        return os.stat(filename).st_mode & 0o777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def _media_src(uri: str) -> str:
+    """Browser-loadable src for *uri*: HTTP(S) URLs as-is, gs:// via the proxy."""
+    if uri.startswith(_HTTP_SCHEMES):
+        return html.escape(uri)
+    return _THUMBNAIL_URL + quote(uri, safe="")
+
+
+def _build_product_section(product: dict, media_pool: Executor) -> str:
+    """Build the HTML section for a single product.
+
+    Inlined videos are downloaded on *media_pool*, which is shared by all
+    sections so concurrent downloads stay bounded report-wide.
+    """
     sku_id = product.get("sku_id", "unknown")
     ground_truth = product.get("ground_truth_description", "")
     source_uris_raw = product.get("image_uris", "")
@@ -15,34 +134,42 @@ def _build_product_section(product: dict) -> str:
     history = product.get("evaluation_history", [])
     passed = product.get("evaluation_passed", False)
 
+    # Attempts mostly re-judge the same rubric questions, so each distinct
+    # string is escaped once per section
+    escaped: dict[str, str] = {}
+
+    def esc(value) -> str:
+        value = str(value)
+        result = escaped.get(value)
+        if result is None:
+            result = escaped[value] = html.escape(value)
+        return result
+
+    # gs:// videos can't go through the thumbnail proxy and are still
+    # inlined; download them up front, since the fetches are independent.
+    # HTTP(S) media is linked directly and never fetched here.
+    video_uris = list(dict.fromkeys(
+        e["image_uri"] for e in history
+        if e.get("image_uri", "").lower().endswith(_VIDEO_EXTENSIONS)
+        and not e["image_uri"].startswith(_HTTP_SCHEMES)
+    ))
+    videos = dict(zip(video_uris, media_pool.map(media_to_base64, video_uris)))
+
     # --- Source images HTML ---
-    source_images_html = ""
+    source_images_parts = []
     for uri in source_uris:
-        name = uri.split("/")[-1]
-        b64_data, mime_type = image_to_base64(uri)
-        if b64_data:
-            img_tag = (
-                f'<img src="data:{mime_type};base64,{b64_data}" '
-                f'alt="{html.escape(name)}" '
-                f'style="max-height:160px;max-width:200px;border-radius:4px;'
-                f'border:1px solid #ccc;">'
-            )
-        else:
-            img_tag = (
-                f'<div style="height:160px;width:160px;background:#eee;'
-                f"display:flex;align-items:center;justify-content:center;"
-                f'border:1px solid #ccc;border-radius:4px;">'
-                f'<span style="font-size:0.8em;color:#555;">'
-                f"{html.escape(name)}</span></div>"
-            )
-        source_images_html += (
-            f'<div style="text-align:center">{img_tag}'
-            f'<div style="font-size:0.8em;margin-top:4px">'
-            f"{html.escape(name)}</div></div>"
+        name = esc(uri.split("/")[-1])
+        source_images_parts.append(
+            f'<div style="text-align:center">'
+            f'<img src="{_media_src(uri)}" alt="{name}" loading="lazy" '
+            f'style="max-height:160px;max-width:200px;border-radius:4px;'
+            f'border:1px solid #ccc;">'
+            f'<div style="font-size:0.8em;margin-top:4px">{name}</div></div>'
         )
+    source_images_html = "".join(source_images_parts)
 
     # --- Attempts HTML ---
-    attempts_html = ""
+    attempts_parts = []
     for entry in history:
         attempt_num = entry["attempt"]
         score = entry["score"]
@@ -58,58 +185,53 @@ def _build_product_section(product: dict) -> str:
 
         # Candidate media (image or video)
         img_html = ""
-        if image_uri:
-            b64_data, mime_type, media_category = media_to_base64(image_uri)
+        if image_uri in videos:
+            b64_data, mime_type, _ = videos[image_uri]
             if b64_data:
-                if media_category == "video":
-                    img_html = (
-                        f'<video src="data:{mime_type};base64,{b64_data}" '
-                        f'controls '
-                        f'style="max-width:100%;border-radius:4px;border:1px solid #eee;">'
-                        f'</video>'
-                    )
-                else:
-                    img_html = (
-                        f'<img src="data:{mime_type};base64,{b64_data}" '
-                        f'alt="Attempt {attempt_num}" '
-                        f'style="max-width:100%;border-radius:4px;border:1px solid #eee;">'
-                    )
+                img_html = (
+                    f'<video src="data:{mime_type};base64,{b64_data}" '
+                    f'controls '
+                    f'style="max-width:100%;border-radius:4px;border:1px solid #eee;">'
+                    f'</video>'
+                )
             else:
                 img_html = (
                     f'<div class="placeholder">Could not load: '
-                    f"{html.escape(image_uri.split('/')[-1])}</div>"
+                    f"{esc(image_uri.split('/')[-1])}</div>"
                 )
-
-        # Verdicts
-        verdicts_html = "<ul class='rubric-list'>"
-        for v in failing:
-            verdicts_html += (
-                f"<li class='rubric-item rubric-fail'>"
-                f"<span class='icon'>&#10007;</span> {html.escape(str(v))}</li>"
+        elif image_uri.lower().endswith(_VIDEO_EXTENSIONS):
+            img_html = (
+                f'<video src="{_media_src(image_uri)}" controls preload="metadata" '
+                f'style="max-width:100%;border-radius:4px;border:1px solid #eee;">'
+                f'</video>'
             )
-        for v in passing:
-            verdicts_html += (
-                f"<li class='rubric-item rubric-pass'>"
-                f"<span class='icon'>&#10003;</span> {html.escape(str(v))}</li>"
+        elif image_uri:
+            img_html = (
+                f'<img src="{_media_src(image_uri)}" '
+                f'alt="Attempt {attempt_num}" loading="lazy" '
+                f'style="max-width:100%;border-radius:4px;border:1px solid #eee;">'
             )
-        verdicts_html += "</ul>"
 
-        total = len(passing) + len(failing)
-        open_attr = "open" if score < 0.7 else ""
+        # Verdicts
+        verdicts_html = "".join([
+            "<ul class='rubric-list'>",
+            *[_FAIL_ITEM + esc(v) + "</li>" for v in failing],
+            *[_PASS_ITEM + esc(v) + "</li>" for v in passing],
+            "</ul>",
+        ])
 
-        attempts_html += f"""
-        <details class="attempt" {open_attr}>
-          <summary>
-            <span class="attempt-label">Attempt {attempt_num}</span>
-            <span class="score-badge {score_class}">{score:.2f}</span>
-            <span class="stats">{len(passing)}/{total} passed</span>
-          </summary>
-          <div class="attempt-content">
-            <div class="attempt-image">{img_html}</div>
-            <div class="attempt-verdicts">{verdicts_html}</div>
-          </div>
-        </details>
-        """
+        n_passed = len(passing)
+        attempts_parts.append(_ATTEMPT_TEMPLATE(
+            open_attr="open" if score < 0.7 else "",
+            attempt_num=attempt_num,
+            score_class=score_class,
+            score=score,
+            n_passed=n_passed,
+            total=n_passed + len(failing),
+            img_html=img_html,
+            verdicts_html=verdicts_html,
+        ))
+    attempts_html = "".join(attempts_parts)
 
     # --- Final score ---
     final_score = history[-1]["score"] if history else 0.0
@@ -119,17 +241,57 @@ def _build_product_section(product: dict) -> str:
     return f"""
     <div class="product-section">
       <h2 class="product-header" style="color:{result_color};">
-        {html.escape(sku_id)} &mdash; {result_label} (Score: {final_score:.2f})
+        {esc(sku_id)} &mdash; {result_label} (Score: {final_score:.2f})
       </h2>
       <div class="meta">
         <div class="meta-images">{source_images_html}</div>
-        <div class="meta-prompt">{html.escape(ground_truth)}</div>
+        <div class="meta-prompt">{esc(ground_truth)}</div>
       </div>
       {attempts_html}
     </div>
     """
 
 
+def _write_report(f, all_products: list[dict], summaries: list[str]) -> None:
+    """Write the full report to binary file *f*, appending a summary line
+    per product to *summaries*.
+    """
+    # Sections are built concurrently (each may download inlined videos)
+    # and written in order. At most _SECTION_WORKERS sections are in flight
+    # or waiting to be written, so a slow early section can't let finished
+    # later ones pile up in memory. The static head and foot are pre-encoded.
+    with ThreadPoolExecutor(
+        max_workers=min(_SECTION_WORKERS, len(all_products))
+    ) as section_pool, ThreadPoolExecutor(max_workers=_MEDIA_WORKERS) as media_pool:
+
+        def submit(product: dict) -> Future:
+            return section_pool.submit(_build_product_section, product, media_pool)
+
+        upcoming = iter(all_products)
+        pending = collections.deque(
+            submit(p) for p in itertools.islice(upcoming, _SECTION_WORKERS)
+        )
+        f.write(_REPORT_HEAD)
+        for i, product in enumerate(all_products):
+            section = pending.popleft().result()
+            # Refill the window before writing so the next build overlaps
+            pending.extend(submit(p) for p in itertools.islice(upcoming, 1))
+            if i:
+                f.write(_PRODUCT_DIVIDER)
+            f.write(section.encode("utf-8"))
+
+            sku_id = product.get("sku_id", "unknown")
+            history = product.get("evaluation_history", [])
+            passed = product.get("evaluation_passed", False)
+            final_score = history[-1]["score"] if history else 0.0
+            result_label = "PASSED" if passed else "NEEDS REVIEW"
+            summaries.append(
+                f"SKU: {sku_id} | Result: {result_label} | "
+                f"Score: {final_score:.2f} | Attempts: {len(history)}"
+            )
+        f.write(_REPORT_FOOT)
+
+
 def create_html_report(tool_context: ToolContext) -> dict:
     """Generate a combined HTML evaluation report for all evaluated products.
 
@@ -143,71 +305,23 @@ def create_html_report(tool_context: ToolContext) -> dict:
     if not all_products:
         return {"status": "error", "message": "No products to report on."}
 
-    # Build per-product sections
-    product_sections = []
-    summaries = []
-    for product in all_products:
-        product_sections.append(_build_product_section(product))
-        sku_id = product.get("sku_id", "unknown")
-        history = product.get("evaluation_history", [])
-        passed = product.get("evaluation_passed", False)
-        final_score = history[-1]["score"] if history else 0.0
-        result_label = "PASSED" if passed else "NEEDS REVIEW"
-        summaries.append(
-            f"SKU: {sku_id} | Result: {result_label} | "
-            f"Score: {final_score:.2f} | Attempts: {len(history)}"
-        )
-
-    sections_html = "\n<hr class='product-divider'>\n".join(product_sections)
-
-    html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<title>Product Fidelity Report</title>
-<style>
-  body {{ font-family:'Segoe UI',Tahoma,Geneva,Verdana,sans-serif; margin:0; background:#f4f4f4; color:#333; }}
-  .container {{ max-width:1100px; margin:30px auto; background:#fff; padding:30px; border-radius:8px; box-shadow:0 2px 15px rgba(0,0,0,.08); }}
-  h1 {{ color:#1a73e8; margin-top:0; border-bottom:2px solid #eee; padding-bottom:10px; }}
-  .product-section {{ margin-bottom:30px; }}
-  .product-header {{ margin-top:0; padding-bottom:8px; border-bottom:1px solid #eee; }}
-  .product-divider {{ border:none; border-top:3px solid #e0e0e0; margin:30px 0; }}
-  .meta {{ display:flex; gap:20px; margin-bottom:20px; background:#f8f9fa; padding:15px; border-radius:6px; }}
-  .meta-images {{ display:flex; gap:12px; flex-wrap:wrap; }}
-  .meta-prompt {{ flex:1; font-size:.9em; line-height:1.5; max-height:200px; overflow-y:auto; white-space:pre-wrap; background:#fff; padding:12px; border:1px solid #eee; border-radius:4px; }}
-  .attempt {{ border:1px solid #e0e0e0; border-radius:8px; margin-bottom:10px; overflow:hidden; }}
-  .attempt[open] {{ box-shadow:0 2px 8px rgba(0,0,0,.1); }}
-  .attempt summary {{ padding:14px 18px; background:#fafafa; cursor:pointer; display:flex; align-items:center; gap:12px; list-style:none; }}
-  .attempt summary::-webkit-details-marker {{ display:none; }}
-  .attempt-label {{ font-weight:600; }}
-  .attempt-content {{ display:flex; gap:20px; padding:18px; }}
-  .attempt-image {{ flex:0 0 250px; }}
-  .attempt-image img, .attempt-image video {{ max-width:100%; height:auto; }}
-  .attempt-verdicts {{ flex:1; }}
-  .score-badge {{ display:inline-block; padding:4px 12px; border-radius:14px; font-weight:bold; font-size:.9em; }}
-  .score-high {{ background:#e6f4ea; color:#188038; }}
-  .score-medium {{ background:#fef7e0; color:#b06000; }}
-  .score-low {{ background:#fce8e6; color:#d93025; }}
-  .stats {{ color:#666; font-size:.85em; }}
-  .rubric-list {{ list-style:none; padding:0; margin:0; }}
-  .rubric-item {{ margin-bottom:5px; padding:8px 10px; border-left:4px solid; border-radius:3px; font-size:.9em; }}
-  .rubric-pass {{ border-color:#188038; background:#f6fef7; }}
-  .rubric-fail {{ border-color:#d93025; background:#fef7f6; }}
-  .icon {{ margin-right:6px; }}
-  .placeholder {{ height:160px; display:flex; align-items:center; justify-content:center; background:#f0f0f0; border-radius:4px; font-size:.85em; color:#888; }}
-</style>
-</head>
-<body>
-<div class="container">
-  <h1>Product Fidelity Report</h1>
-  {sections_html}
-</div>
-</body>
-</html>"""
-
     filename = "product_candidate_report.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    summaries = []
+    # Written to a uniquely named temp file and swapped in, so /api/report
+    # never serves a partial report and concurrent runs don't share a temp
+    # file
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)), suffix=".html.tmp"
+    )
+    try:
+        os.fchmod(fd, report_file_mode(filename))
+        with open(fd, "wb", buffering=1 << 20) as f:
+            _write_report(f, all_products, summaries)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_filename)
+        raise
 
     summary = (
         f"Total products: {len(all_products)}\n"
@@ -66,7 +66,7 @@ def generate_product_video(tool_context: ToolContext) -> dict:
 
     reference_images = []
     for uri in uris:
-        ext = uri.lower().rsplit(".", 1)[-1]
+        ext = uri.rpartition(".")[2].lower()
         mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
         reference_images.append(
             VideoGenerationReferenceImage(
@@ -1,28 +1,43 @@
 import asyncio
-import json
+import functools
+import gzip
+import logging
 import os
+import threading
 import time
+from collections.abc import Iterator
 from io import BytesIO
 from pathlib import Path
 
-# Load .env before any imports that read config
-_env_path = Path(__file__).resolve().parent / ".env"
-if _env_path.exists():
-    with open(_env_path) as _f:
-        for _line in _f:
-            _line = _line.strip()
-            if _line and not _line.startswith("#") and "=" in _line:
-                _key, _, _val = _line.partition("=")
-                os.environ.setdefault(_key.strip(), _val.strip())
-
-from fastapi import Query, Response
+from dotenv import load_dotenv
+
+# Load .env before any imports that read config; existing variables win
+load_dotenv(Path(__file__).resolve().parent / ".env", override=False)
+
+import orjson
+from fastapi import Query, Request, Response
 from fastapi.responses import FileResponse, StreamingResponse
 from google.adk.cli.fast_api import get_fast_api_app
-from google.cloud import storage
 from PIL import Image
 from pydantic import BaseModel
 
+try:
+    # libvips shrinks JPEGs on load and resizes with SIMD; optional, since
+    # it needs the libvips shared library on the host
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
 from batch.pipeline import run_batch
+from product_fidelity_agent.tools.gcs import get_etag, get_storage_client, read_from_gcs
+
+logger = logging.getLogger(__name__)
+
+
+def _json_bytes(obj) -> bytes:
+    # Pipeline scores can come through pandas as numpy scalars
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
 
 # ---------------------------------------------------------------------------
 # ADK app
@@ -42,36 +57,131 @@ IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
 CACHE_TTL = 300  # 5 minutes
 
 _gcs_list_cache: dict[str, tuple[float, list[str]]] = {}
+_gcs_list_lock = threading.Lock()
 
 
-def _get_storage_client() -> storage.Client:
-    return storage.Client()
+class _Listing:
+    """A full listing of one prefix, built on a background thread.
 
+    Readers can wait for just the first N images instead of starting a
+    listing of their own, so each prefix is only ever listed once at a time.
+    """
+
+    def __init__(self) -> None:
+        self.images: list[str] = []
+        self.done = False
+        self.error: Exception | None = None
+        self.cond = threading.Condition()
+
+    def wait_for(self, count: int | None = None) -> tuple[list[str], bool]:
+        """Block until *count* images are listed (all, if None) or the listing ends.
+
+        Returns (images so far, whether the listing is complete).
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.done or (count is not None and len(self.images) >= count)
+            )
+            if self.error is not None:
+                raise self.error
+            return self.images[:count], self.done
 
-def _list_images_cached(prefix: str) -> list[str]:
-    """Return all image blob URIs under *prefix*, with a TTL cache."""
-    now = time.time()
-    if prefix in _gcs_list_cache:
-        ts, images = _gcs_list_cache[prefix]
-        if now - ts < CACHE_TTL:
-            return images
 
+# Prefixes with a listing in flight
+_gcs_list_pending: dict[str, _Listing] = {}
+
+
+def _iter_images(prefix: str) -> Iterator[str]:
+    """Yield image blob URIs under *prefix* (a path without gs://).
+
+    list_blobs fetches result pages lazily, so stopping early only costs
+    the pages actually consumed.
+    """
     # prefix arrives without gs:// — e.g. "bucket/path/to/images/"
     parts = prefix.split("/", 1)
     bucket_name = parts[0]
     blob_prefix = parts[1] if len(parts) > 1 else ""
 
-    client = _get_storage_client()
+    client = get_storage_client()
     blobs = client.list_blobs(bucket_name, prefix=blob_prefix)
-    images = [
+    return (
         f"gs://{bucket_name}/{b.name}"
         for b in blobs
         if b.name.lower().endswith(IMAGE_EXTENSIONS)
-    ]
-    _gcs_list_cache[prefix] = (now, images)
+    )
+
+
+def _refresh_list(prefix: str, listing: _Listing) -> None:
+    try:
+        for uri in _iter_images(prefix):
+            with listing.cond:
+                listing.images.append(uri)
+                listing.cond.notify_all()
+        _gcs_list_cache[prefix] = (time.time(), listing.images)
+    except Exception as e:
+        logger.warning("Could not refresh listing for %s: %s", prefix, e)
+        listing.error = e
+    finally:
+        with _gcs_list_lock:
+            _gcs_list_pending.pop(prefix, None)
+        with listing.cond:
+            listing.done = True
+            listing.cond.notify_all()
+
+
+def _start_refresh(prefix: str) -> _Listing:
+    """Re-list *prefix* on a background thread, unless already doing so.
+
+    Returns the listing in flight for *prefix*.
+    """
+    with _gcs_list_lock:
+        listing = _gcs_list_pending.get(prefix)
+        if listing is not None:
+            return listing
+        listing = _gcs_list_pending[prefix] = _Listing()
+    threading.Thread(
+        target=_refresh_list, args=(prefix, listing), daemon=True
+    ).start()
+    return listing
+
+
+def _list_images_cached(prefix: str) -> list[str]:
+    """Return all image blob URIs under *prefix*, with a TTL cache.
+
+    An expired entry is still returned (stale-while-revalidate) while a
+    single background thread refreshes it, so only a cold prefix waits
+    on the listing.
+    """
+    cached = _gcs_list_cache.get(prefix)
+    if cached is None:
+        return _start_refresh(prefix).wait_for()[0]
+
+    ts, images = cached
+    if time.time() - ts >= CACHE_TTL:
+        _start_refresh(prefix)
     return images
 
 
+def _list_images_page(
+    prefix: str, page: int, page_size: int
+) -> tuple[list[str], int, bool]:
+    """Return (images on *page*, image count, whether the count is final).
+
+    A cached listing is sliced directly. For a cold prefix the request only
+    waits until the background listing has filled the page (plus one, to
+    tell whether another page follows); the count is then a lower bound
+    until that listing lands.
+    """
+    start = page * page_size
+    end = start + page_size
+    if prefix in _gcs_list_cache:
+        images = _list_images_cached(prefix)
+        return images[start:end], len(images), True
+
+    head, complete = _start_refresh(prefix).wait_for(end + 1)
+    return head[start:end], len(head), complete
+
+
 # ---------------------------------------------------------------------------
 # GCS proxy endpoints
 # ---------------------------------------------------------------------------
@@ -83,41 +193,69 @@ def gcs_list(
     page: int = Query(0, ge=0),
     page_size: int = Query(20, ge=1, le=100),
 ):
-    images = _list_images_cached(prefix)
-    total = len(images)
+    images, total, total_known = _list_images_page(prefix, page, page_size)
     total_pages = max(1, (total + page_size - 1) // page_size)
-    start = page * page_size
-    end = start + page_size
+    # While a cold prefix is still being listed, total and total_pages are
+    # lower bounds (enough to page forward) and total_known is false
     return {
-        "images": images[start:end],
+        "images": images,
         "total": total,
         "page": page,
         "total_pages": total_pages,
+        "total_known": total_known,
     }
 
 
-@app.get("/api/gcs/thumbnail")
-def gcs_thumbnail(
-    uri: str = Query(..., description="Full gs:// URI"),
-):
-    path = uri[5:]  # strip "gs://"
-    bucket_name = path.split("/")[0]
-    blob_path = "/".join(path.split("/")[1:])
+THUMBNAIL_CACHE_SIZE = 256
 
-    client = _get_storage_client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-    raw_bytes = blob.download_as_bytes()
 
-    img = Image.open(BytesIO(raw_bytes)).convert("RGB")
+def _render_thumbnail(raw_bytes: bytes) -> bytes:
+    """Downscale an image to at most 300px wide and encode it as JPEG."""
     max_width = 300
+    if pyvips is not None:
+        # thumbnail fits a width x width box unless given a height; pass a
+        # large one so only the width constrains, and never upscale
+        img = pyvips.Image.thumbnail_buffer(
+            raw_bytes, max_width, height=100_000, size="down"
+        )
+        return img.jpegsave_buffer(Q=60)
+
+    img = Image.open(BytesIO(raw_bytes))
     if img.width > max_width:
-        ratio = max_width / img.width
-        img = img.resize((max_width, int(img.height * ratio)))
+        size = (max_width, max(1, int(img.height * (max_width / img.width))))
+        # Image.open only read the header: let libjpeg decode JPEGs at a
+        # reduced DCT scale (never below size) before thumbnail finishes
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        img.thumbnail(size)
+    else:
+        img = img.convert("RGB")
 
     buf = BytesIO()
     img.save(buf, "JPEG", quality=60)
-    return Response(content=buf.getvalue(), media_type="image/jpeg")
+    return buf.getvalue()
+
+
+# Keyed by etag as well as URI, so an overwritten object is re-rendered
+# rather than served stale; get_etag reuses recent lookups, so repeat
+# requests for a thumbnail skip the metadata round trip too
+@functools.lru_cache(maxsize=THUMBNAIL_CACHE_SIZE)
+def _thumbnail_bytes(uri: str, etag: str) -> bytes:
+    return _render_thumbnail(read_from_gcs(uri))
+
+
+@app.get("/api/gcs/thumbnail")
+async def gcs_thumbnail(
+    uri: str = Query(..., description="Full gs:// URI"),
+):
+    # Both steps block on GCS (and PIL on a miss), so keep them off the event loop
+    etag = await asyncio.to_thread(get_etag, uri)
+    content = await asyncio.to_thread(_thumbnail_bytes, uri, etag)
+    return Response(
+        content=content,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "public, max-age=3600"},
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -125,13 +263,40 @@ def gcs_thumbnail(
 # ---------------------------------------------------------------------------
 
 REPORT_FILE = "product_candidate_report.html"
+GZIP_MIN_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=4)
+def _gzipped_file(path: str, mtime_ns: int) -> bytes:
+    # Keyed by mtime, so a regenerated report is recompressed
+    with open(path, "rb") as f:
+        return gzip.compress(f.read(), compresslevel=6)
+
+
+def _html_file_response(request: Request, path: str) -> Response:
+    """Serve an HTML report, gzip-compressed when the client accepts it.
+
+    Compression is applied here rather than with GZipMiddleware so the
+    SSE endpoints are never buffered by the compressor.
+    """
+    st = os.stat(path)
+    if (
+        st.st_size < GZIP_MIN_SIZE
+        or "gzip" not in request.headers.get("accept-encoding", "")
+    ):
+        return FileResponse(path, media_type="text/html")
+    return Response(
+        content=_gzipped_file(path, st.st_mtime_ns),
+        media_type="text/html",
+        headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+    )
 
 
 @app.get("/api/report")
-def get_report():
+def get_report(request: Request):
     if not os.path.isfile(REPORT_FILE):
         return Response(content="No report generated yet.", status_code=404)
-    return FileResponse(REPORT_FILE, media_type="text/html")
+    return _html_file_response(request, REPORT_FILE)
 
 
 # ---------------------------------------------------------------------------
@@ -155,7 +320,7 @@ async def batch_start(body: BatchStartRequest):
 
     if _batch_state and not _batch_state["task"].done():
         return Response(
-            content=json.dumps({"error": "A batch is already running."}),
+            content=_json_bytes({"error": "A batch is already running."}),
             status_code=409,
             media_type="application/json",
         )
@@ -165,19 +330,19 @@ async def batch_start(body: BatchStartRequest):
         clean_prefix = body.prefix
         if clean_prefix.startswith("gs://"):
             clean_prefix = clean_prefix[5:]
-        uris = _list_images_cached(clean_prefix)
+        uris = await asyncio.to_thread(_list_images_cached, clean_prefix)
     elif body.image_uris:
         uris = body.image_uris
     else:
         return Response(
-            content=json.dumps({"error": "No images specified."}),
+            content=_json_bytes({"error": "No images specified."}),
             status_code=400,
             media_type="application/json",
         )
 
     if not uris:
         return Response(
-            content=json.dumps({"error": "No images found."}),
+            content=_json_bytes({"error": "No images found."}),
             status_code=400,
             media_type="application/json",
         )
@@ -210,11 +375,14 @@ async def batch_start(body: BatchStartRequest):
     return {"batch_id": "current", "image_count": len(uris)}
 
 
+_SSE_KEEPALIVE = b"data: " + _json_bytes({"status": "keepalive"}) + b"\n\n"
+
+
 @app.get("/api/batch/status")
 async def batch_status():
     if not _batch_state:
         return Response(
-            content=json.dumps({"error": "No batch running."}),
+            content=_json_bytes({"error": "No batch running."}),
             status_code=404,
             media_type="application/json",
         )
@@ -224,12 +392,12 @@ async def batch_status():
         while True:
             try:
                 event = await asyncio.wait_for(queue.get(), timeout=30.0)
-                yield f"data: {json.dumps(event)}\n\n"
+                yield b"data: " + _json_bytes(event) + b"\n\n"
                 if event.get("status") == "complete":
                     break
             except asyncio.TimeoutError:
                 # Send keepalive
-                yield f"data: {json.dumps({'status': 'keepalive'})}\n\n"
+                yield _SSE_KEEPALIVE
             except Exception:
                 break
 
@@ -248,10 +416,10 @@ BATCH_REPORT_FILE = "batch_report.html"
 
 
 @app.get("/api/batch/report")
-def batch_report():
+def batch_report(request: Request):
     if not os.path.isfile(BATCH_REPORT_FILE):
         return Response(content="No batch report generated yet.", status_code=404)
-    return FileResponse(BATCH_REPORT_FILE, media_type="text/html")
+    return _html_file_response(request, BATCH_REPORT_FILE)
 
 
 @app.post("/api/batch/cancel")
@@ -260,7 +428,7 @@ async def batch_cancel():
 
     if not _batch_state or _batch_state["task"].done():
         return Response(
-            content=json.dumps({"error": "No batch running."}),
+            content=_json_bytes({"error": "No batch running."}),
             status_code=404,
             media_type="application/json",
         )